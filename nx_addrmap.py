@@ -0,0 +1,143 @@
+#!/usr/bin/python3
+import sys
+import bisect
+from nx_meta import metaLoad, metaKcToDict
+
+# Firmware-wide physical address map, built from the MemoryMap/IoMemoryMap KC descriptors of every NPDM/KIP.
+# The ranges are sorted by BeginAddress, with a max-EndAddress tree over them, so that point/range queries are O(log n + matches).
+
+def addrMapTitleId(ProgramId, Name):
+    return "%016X_%s" % (ProgramId, Name)
+
+def addrMapKcEntries(Kc, Title, ProgramId, Name):
+    out = []
+    Values = metaKcToDict(Kc)
+
+    for Desc in Values.get('MemoryMap', []):
+        out.append({'Title': Title, 'ProgramId': ProgramId, 'Name': Name, 'Type': 'MemoryMap', 'BeginAddress': Desc['BeginAddress'], 'EndAddress': Desc['BeginAddress']+Desc['Size'], 'Size': Desc['Size'], 'PermissionType': Desc['PermissionType'], 'MappingType': Desc['MappingType']})
+
+    for Desc in Values.get('IoMemoryMap', []):
+        out.append({'Title': Title, 'ProgramId': ProgramId, 'Name': Name, 'Type': 'IoMemoryMap', 'BeginAddress': Desc['BeginAddress'], 'EndAddress': Desc['BeginAddress']+0x1000, 'Size': 0x1000, 'PermissionType': 'RW', 'MappingType': 'Io'})
+
+    return out
+
+# InLoaded is a list of metaLoad output, for either NPDM or INI1.
+def addrMapBuild(InLoaded):
+    Entries = []
+    for Loaded in InLoaded:
+        if Loaded is None:
+            continue
+        if 'Meta' in Loaded:
+            Meta = Loaded['Meta']
+            ProgramId = Meta['Aci']['ProgramId']
+            Entries+= addrMapKcEntries(Meta['Aci']['Kc'], addrMapTitleId(ProgramId, Meta['Name']), ProgramId, Meta['Name'])
+        elif 'Ini1' in Loaded:
+            for Kip in Loaded['Ini1']['Kips']:
+                Entries+= addrMapKcEntries(Kip['Kc'], addrMapTitleId(Kip['ProgramId'], Kip['Name']), Kip['ProgramId'], Kip['Name'])
+
+    Entries.sort(key=lambda Entry: (Entry['BeginAddress'], Entry['EndAddress'], Entry['Title']))
+
+    # Implicit segment tree: MaxEnd[TreeSize+i] is the EndAddress of Entries[i], and each parent node is the max of its children.
+    TreeSize = 1
+    while TreeSize < len(Entries):
+        TreeSize<<=1
+    MaxEnd = [0] * (TreeSize*2)
+    for i, Entry in enumerate(Entries):
+        MaxEnd[TreeSize+i] = Entry['EndAddress']
+    for i in range(TreeSize-1, 0, -1):
+        MaxEnd[i] = max(MaxEnd[i*2], MaxEnd[i*2+1])
+
+    return {'Entries': Entries, 'Starts': [Entry['BeginAddress'] for Entry in Entries], 'TreeSize': TreeSize, 'MaxEnd': MaxEnd}
+
+def addrMapBuildPathArray(InPaths):
+    return addrMapBuild([metaLoad(path) for path in InPaths])
+
+# Returns the entries overlapping [BeginAddress, EndAddress).
+def addrMapQueryRange(Map, BeginAddress, EndAddress):
+    out = []
+    Limit = bisect.bisect_left(Map['Starts'], EndAddress)
+    if Limit==0:
+        return out
+
+    TreeSize = Map['TreeSize']
+    MaxEnd = Map['MaxEnd']
+    Stack = [(1, 0, TreeSize)]
+    while len(Stack)>0:
+        Node, Left, Right = Stack.pop()
+        if Left >= Limit or MaxEnd[Node] <= BeginAddress:
+            continue
+        if Node >= TreeSize:
+            out.append(Map['Entries'][Left])
+            continue
+        Mid = (Left+Right)>>1
+        Stack.append((Node*2+1, Mid, Right))
+        Stack.append((Node*2, Left, Mid))
+
+    return out
+
+def addrMapQueryPoint(Map, Address):
+    return addrMapQueryRange(Map, Address, Address+1)
+
+# Returns a list of (Entry0, Entry1) for ranges from different titles which overlap.
+def addrMapOverlaps(Map):
+    out = []
+    Active = []
+    for Entry in Map['Entries']:
+        Active = [ActiveEntry for ActiveEntry in Active if ActiveEntry['EndAddress'] > Entry['BeginAddress']]
+        for ActiveEntry in Active:
+            if ActiveEntry['Title'] != Entry['Title']:
+                out.append((ActiveEntry, Entry))
+        Active.append(Entry)
+    return out
+
+def addrMapEntryKey(Entry):
+    return (Entry['Title'], Entry['Type'], Entry['BeginAddress'])
+
+def addrMapDiff(Prev, Cur):
+    Out = {}
+
+    Updated = []
+    Added = []
+    Removed = []
+
+    PrevEntries = {addrMapEntryKey(Entry): Entry for Entry in Prev['Entries']}
+    CurEntries = {addrMapEntryKey(Entry): Entry for Entry in Cur['Entries']}
+
+    for Key, Entry in CurEntries.items():
+        PrevEntry = PrevEntries.get(Key)
+        if PrevEntry is None:
+            Added.append(Entry)
+        elif PrevEntry != Entry:
+            Updated.append((PrevEntry, Entry))
+
+    for Key, PrevEntry in PrevEntries.items():
+        if Key not in CurEntries:
+            Removed.append(PrevEntry)
+
+    if len(Updated)>0:
+        Out['Updated'] = Updated
+    if len(Added)>0:
+        Out['Added'] = Added
+    if len(Removed)>0:
+        Out['Removed'] = Removed
+
+    return Out
+
+def addrMapEntryToStr(Entry):
+    return "0x%010X-0x%010X %s %s %-11s %s" % (Entry['BeginAddress'], Entry['EndAddress'], Entry['PermissionType'], Entry['MappingType'].ljust(6), Entry['Type'], Entry['Title'])
+
+if __name__ == "__main__":
+    if len(sys.argv)>3 and sys.argv[1]=='--point':
+        Map = addrMapBuildPathArray(sys.argv[3:])
+        for Entry in addrMapQueryPoint(Map, int(sys.argv[2], 0)):
+            print(addrMapEntryToStr(Entry))
+    elif len(sys.argv)>2 and sys.argv[1]=='--overlaps':
+        Map = addrMapBuildPathArray(sys.argv[2:])
+        for Entry0, Entry1 in addrMapOverlaps(Map):
+            print("%s\n  overlaps %s" % (addrMapEntryToStr(Entry0), addrMapEntryToStr(Entry1)))
+    elif len(sys.argv)>1:
+        Map = addrMapBuildPathArray(sys.argv[1:])
+        for Entry in Map['Entries']:
+            print(addrMapEntryToStr(Entry))
+    else:
+        print("Usage:\n%s [--point <address> | --overlaps] <NPDM/INI1 path>..." % (sys.argv[0]))
@@ -0,0 +1,158 @@
+#!/usr/bin/python3
+import os
+import sys
+import mmap
+import struct
+from nx_meta import metaLoadData
+
+# Reads files directly from PFS0 (ExeFS/NSP) and HFS0 (XCI) containers, without extracting them. The container is mmap'd once, and the parsers are given memoryviews bounded to each file's offset/size.
+# Only unencrypted images are supported.
+
+def containerParse(path, view):
+    out = None
+    viewlen = len(view)
+
+    if viewlen < 0x10:
+        print("containerParse('%s'): Data is too small." % (path))
+        return None
+
+    magicnum, NumFiles, StringTableSize, Reserved_xC = struct.unpack('<IIII', view[0x0:0x10])
+    if magicnum==0x30534650: # PFS0
+        EntrySize = 0x18
+        Type = 'Pfs0'
+    elif magicnum==0x30534648: # HFS0
+        EntrySize = 0x40
+        Type = 'Hfs0'
+    else:
+        print("Bad magicnum (0x%x) for containerParse('%s')." % (magicnum, path))
+        return None
+
+    StringTableOffset = 0x10 + NumFiles*EntrySize
+    DataOffset = StringTableOffset + StringTableSize
+    if DataOffset > viewlen:
+        print("containerParse('%s'): File table is too large for the data size." % (path))
+        return None
+
+    StringTable = view[StringTableOffset:DataOffset]
+
+    out = {'Type': Type, 'Files': []}
+    for i in range(NumFiles):
+        pos = 0x10 + i*EntrySize
+        Offset, Size, NameOffset = struct.unpack('<QQI', view[pos:pos+0x14])
+        Entry = {'Offset': DataOffset+Offset, 'Size': Size}
+        if Type=='Hfs0':
+            HashedSize = struct.unpack('<I', view[pos+0x14:pos+0x18])[0]
+            Entry['HashedSize'] = HashedSize
+            Entry['Hash'] = bytes(view[pos+0x20:pos+0x40])
+
+        if NameOffset >= StringTableSize:
+            print("containerParse('%s'): Invalid NameOffset for entry %d." % (path, i))
+            return None
+        NameEnd = NameOffset
+        while NameEnd < StringTableSize and StringTable[NameEnd]!=0x0:
+            NameEnd=NameEnd+1
+        Entry['Name'] = bytes(StringTable[NameOffset:NameEnd]).decode('utf8')
+
+        if Entry['Offset']+Size > viewlen:
+            print("containerParse('%s'): Offset/size for %s is invalid." % (path, Entry['Name']))
+            return None
+
+        out['Files'].append(Entry)
+
+    return out
+
+def containerOpen(path):
+    if os.path.exists(path) is False:
+        print("containerOpen(): File doesn't exist: %s" % (path))
+        return None
+
+    with open(path, 'rb') as tmpf:
+        if os.fstat(tmpf.fileno()).st_size == 0:
+            print("containerOpen(): File is empty: %s" % (path))
+            return None
+        tmpmap = mmap.mmap(tmpf.fileno(), 0, access=mmap.ACCESS_READ)
+
+    view = memoryview(tmpmap)
+    out = containerParse(path, view)
+    if out is None:
+        view.release()
+        tmpmap.close()
+        return None
+
+    out['path'] = path
+    out['mmap'] = tmpmap
+    out['view'] = view
+    return out
+
+# Any views returned by containerGetFileView must be released before this is used.
+def containerClose(Container):
+    Container['view'].release()
+    Container['mmap'].close()
+
+def containerFindFile(Container, Name):
+    for Entry in Container['Files']:
+        if Entry['Name'] == Name:
+            return Entry
+    return None
+
+def containerGetFileView(Container, Name):
+    Entry = containerFindFile(Container, Name)
+    if Entry is None:
+        print("containerGetFileView('%s'): File not found: %s" % (Container['path'], Name))
+        return None
+    return Container['view'][Entry['Offset']:Entry['Offset']+Entry['Size']]
+
+# This allows accessing nested containers, such as the partitions in the root HFS0 of a XCI.
+def containerOpenNested(Container, Name):
+    view = containerGetFileView(Container, Name)
+    if view is None:
+        return None
+
+    path = "%s/%s" % (Container['path'], Name)
+    out = containerParse(path, view)
+    if out is None:
+        view.release()
+        return None
+
+    out['path'] = path
+    out['mmap'] = None
+    out['view'] = view
+    return out
+
+def containerCloseNested(Container):
+    Container['view'].release()
+
+def containerMetaLoad(Container, Name='main.npdm'):
+    view = containerGetFileView(Container, Name)
+    if view is None:
+        return None
+    with view:
+        return metaLoadData("%s/%s" % (Container['path'], Name), view)
+
+def containerBdfRead(Container, Name, load_x509=True):
+    from ssl_bdf import bdf_read_data
+
+    view = containerGetFileView(Container, Name)
+    if view is None:
+        return None
+    with view:
+        return bdf_read_data("%s/%s" % (Container['path'], Name), view, load_x509)
+
+# Yields (Name, metaLoad output) for every .npdm in the container.
+def containerMetaLoadAll(Container):
+    for Entry in Container['Files']:
+        if Entry['Name'].endswith('.npdm'):
+            yield Entry['Name'], containerMetaLoad(Container, Entry['Name'])
+
+if __name__ == "__main__":
+    if len(sys.argv)>1:
+        Container = containerOpen(sys.argv[1])
+        if Container is not None:
+            if len(sys.argv)>2:
+                print(containerMetaLoad(Container, sys.argv[2]))
+            else:
+                for Name, out in containerMetaLoadAll(Container):
+                    print("%s: %s" % (Name, out))
+            containerClose(Container)
+    else:
+        print("Usage:\n%s <PFS0/HFS0 path> [npdm path within container]" % (sys.argv[0]))
@@ -0,0 +1,333 @@
+#!/usr/bin/python3
+import os
+import sys
+import json
+import struct
+import select
+import socket
+import threading
+import socketserver
+import ctypes
+import ctypes.util
+from nx_meta import metaLoad, metaDiff, metaDiffIni1, metaJsonDefault
+from nx_intern import InternScope
+
+# Long-running daemon which keeps parsed Meta/Ini1/BDF state warm in memory for the watched firmware directories, only re-parsing files which changed.
+# Requests are handled over a Unix domain socket: each request is a JSON object on a single line, and each response is a JSON object on a single line: {"ok": true, "result": ...} or {"ok": false, "error": "..."}.
+# Requests: {"op": "load", "path": ...}, {"op": "diff", "prev": ..., "cur": ...}, {"op": "query", "ProgramId"/"Name"/"fingerprint": ...}, {"op": "list"}.
+
+IN_CLOSE_WRITE = 0x8
+IN_MOVED_FROM = 0x40
+IN_MOVED_TO = 0x80
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_DELETE_SELF = 0x400
+IN_Q_OVERFLOW = 0x4000
+IN_ISDIR = 0x40000000
+
+DAEMON_INOTIFY_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF
+
+def daemonStateCreate(Roots):
+    return {'lock': threading.RLock(), 'roots': [os.path.abspath(Root) for Root in Roots], 'files': {}, 'stop': threading.Event()}
+
+def daemonDetectType(path):
+    try:
+        with open(path, 'rb') as tmpf:
+            data = tmpf.read(0x200)
+    except OSError:
+        return None
+
+    if len(data) < 0x4:
+        return None
+
+    magicnum = struct.unpack('<I', data[0x0:0x4])[0]
+    if magicnum==0x4154454d or magicnum==0x31494e49: # META / INI1
+        return 'Meta'
+    elif magicnum==0x546c7373:
+        return 'Bdf'
+    elif len(data)>=0x154 and struct.unpack('<I', data[0x150:0x154])[0]==0x31324b50: # Decrypted Package2
+        return 'Meta'
+    return None
+
+# Malformed files are stored with out=None and the error text, instead of raising, since this runs in the watch thread. Any exception is caught since the parsers aren't hardened against every malformed input.
+def daemonParseFile(path, Type):
+    out = {'Type': Type}
+    try:
+        if Type=='Meta':
+            out['out'] = metaLoad(path)
+        elif Type=='Bdf':
+            from ssl_bdf import bdf_read, bdf_fingerprint
+
+            out['out'] = bdf_read(path)
+            if out['out'] is not None:
+                out['fingerprints'] = [bdf_fingerprint(entry['data']) for entry in out['out']]
+    except Exception as e:
+        print("daemonParseFile('%s'): Failed to parse: %s: %s" % (path, type(e).__name__, e))
+        out['out'] = None
+        out['error'] = "%s: %s" % (type(e).__name__, e)
+    return out
+
+# Parses the file when it isn't already loaded or when the mtime/size changed. Returns the state entry, or None when the file isn't a supported format.
+def daemonScanFile(State, path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        daemonRemovePath(State, path)
+        return None
+
+    with State['lock']:
+        Entry = State['files'].get(path)
+        if Entry is not None and Entry['mtime_ns']==st.st_mtime_ns and Entry['size']==st.st_size:
+            return Entry
+
+    Type = daemonDetectType(path)
+    Entry = {'mtime_ns': st.st_mtime_ns, 'size': st.st_size, 'Type': Type, 'out': None}
+    if Type is not None:
+        Entry.update(daemonParseFile(path, Type))
+
+    with State['lock']:
+        State['files'][path] = Entry
+    return Entry
+
+def daemonRemovePath(State, path):
+    prefix = path + os.sep
+    with State['lock']:
+        for tmppath in [tmppath for tmppath in State['files'] if tmppath==path or tmppath.startswith(prefix)]:
+            del State['files'][tmppath]
+
+def daemonScanDir(State, dirpath):
+    Found = set()
+    for curdir, dirnames, filenames in os.walk(dirpath):
+        for filename in filenames:
+            path = os.path.join(curdir, filename)
+            Found.add(path)
+            daemonScanFile(State, path)
+
+    prefix = dirpath + os.sep
+    with State['lock']:
+        for tmppath in [tmppath for tmppath in State['files'] if tmppath.startswith(prefix) and tmppath not in Found]:
+            del State['files'][tmppath]
+
+def daemonScanAll(State):
+    for Root in State['roots']:
+        daemonScanDir(State, Root)
+
+def daemonWatchPoll(State, Interval):
+    while State['stop'].wait(Interval) is False:
+        daemonScanAll(State)
+
+def daemonInotifyInit():
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        fd = libc.inotify_init1(os.O_CLOEXEC)
+    except (OSError, AttributeError):
+        return None, None
+    if fd < 0:
+        return None, None
+    return libc, fd
+
+def daemonInotifyAddTree(libc, fd, Watches, dirpath):
+    for curdir, dirnames, filenames in os.walk(dirpath):
+        wd = libc.inotify_add_watch(fd, os.fsencode(curdir), DAEMON_INOTIFY_MASK)
+        if wd < 0:
+            print("daemonInotifyAddTree(): inotify_add_watch failed for %s: %s" % (curdir, os.strerror(ctypes.get_errno())))
+            continue
+        Watches[wd] = curdir
+
+def daemonWatchInotify(State, libc, fd):
+    Watches = {}
+    for Root in State['roots']:
+        daemonInotifyAddTree(libc, fd, Watches, Root)
+
+    while State['stop'].is_set() is False:
+        ready, _, _ = select.select([fd], [], [], 1.0)
+        if len(ready)==0:
+            continue
+
+        data = os.read(fd, 0x10000)
+        pos=0
+        while pos+0x10 <= len(data):
+            wd, mask, cookie, namelen = struct.unpack('<iIII', data[pos:pos+0x10])
+            name = data[pos+0x10:pos+0x10+namelen].rstrip(b'\0')
+            pos=pos+0x10+namelen
+
+            if mask & IN_Q_OVERFLOW:
+                daemonScanAll(State)
+                continue
+
+            dirpath = Watches.get(wd)
+            if dirpath is None:
+                continue
+            if mask & IN_DELETE_SELF:
+                del Watches[wd]
+                continue
+
+            path = os.path.join(dirpath, os.fsdecode(name))
+            if mask & (IN_DELETE | IN_MOVED_FROM):
+                daemonRemovePath(State, path)
+            elif mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO):
+                    daemonInotifyAddTree(libc, fd, Watches, path)
+                    daemonScanDir(State, path)
+            elif mask & (IN_CLOSE_WRITE | IN_MOVED_TO):
+                daemonScanFile(State, path)
+
+    os.close(fd)
+
+# Uses inotify when available, otherwise the watched directories are polled.
+def daemonWatchStart(State, PollInterval=5.0, UseInotify=True):
+    daemonScanAll(State)
+
+    libc, fd = (None, None)
+    if UseInotify:
+        libc, fd = daemonInotifyInit()
+
+    if fd is not None:
+        thread = threading.Thread(target=daemonWatchInotify, args=(State, libc, fd), daemon=True)
+    else:
+        print("daemonWatchStart(): inotify is not available, polling every %.1fs." % (PollInterval))
+        thread = threading.Thread(target=daemonWatchPoll, args=(State, PollInterval), daemon=True)
+    thread.start()
+    return thread
+
+def daemonGet(State, path):
+    path = os.path.abspath(path)
+    Entry = daemonScanFile(State, path)
+    if Entry is None:
+        raise ValueError("File doesn't exist: %s" % (path))
+    if Entry['Type'] is None:
+        raise ValueError("Unsupported file format: %s" % (path))
+    if Entry['out'] is None:
+        if 'error' in Entry:
+            raise ValueError("Failed to load: %s: %s" % (path, Entry['error']))
+        raise ValueError("Failed to load: %s" % (path))
+    return Entry
+
+def daemonDiff(State, PrevPath, CurPath):
+    Prev = daemonGet(State, PrevPath)
+    Cur = daemonGet(State, CurPath)
+
+    if Prev['Type']=='Bdf' and Cur['Type']=='Bdf':
+        from ssl_bdf import bdf_diff
+        return bdf_diff(Prev['out'], Cur['out'])
+
+    Prev = Prev['out']
+    Cur = Cur['out']
+    if 'Meta' in Prev and 'Meta' in Cur:
+        return metaDiff(Prev['Meta'], Cur['Meta'])
+    elif 'Ini1' in Prev and 'Ini1' in Cur:
+        return metaDiffIni1(Prev['Ini1'], Cur['Ini1'])
+    raise ValueError("Prev/Cur formats don't match.")
+
+def daemonQuery(State, Request):
+    ProgramId = Request.get('ProgramId')
+    if isinstance(ProgramId, str):
+        ProgramId = int(ProgramId, 16)
+    Name = Request.get('Name')
+    Fingerprint = Request.get('fingerprint')
+    if Fingerprint is not None:
+        Fingerprint = Fingerprint.lower()
+
+    out = []
+    with State['lock']:
+        Files = list(State['files'].items())
+
+    for path, Entry in Files:
+        if Entry['out'] is None:
+            continue
+
+        if Entry['Type']=='Bdf':
+            if Fingerprint is None:
+                continue
+            for entry, fingerprint in zip(Entry['out'], Entry['fingerprints']):
+                if fingerprint==Fingerprint:
+                    out.append({'path': path, 'id': entry['id'], 'status': entry['status']})
+            continue
+
+        if 'Meta' in Entry['out']:
+            Meta = Entry['out']['Meta']
+            Titles = [{'Name': Meta['Name'], 'ProgramId': Meta['Aci']['ProgramId'], 'Version': Meta['Version']}]
+        else:
+            Titles = [{'Name': Kip['Name'], 'ProgramId': Kip['ProgramId'], 'Version': Kip['Version']} for Kip in Entry['out']['Ini1']['Kips']]
+
+        for Title in Titles:
+            if ProgramId is not None and Title['ProgramId']!=ProgramId:
+                continue
+            if Name is not None and Title['Name']!=Name:
+                continue
+            if ProgramId is None and Name is None:
+                continue
+            Title['path'] = path
+            out.append(Title)
+
+    return out
+
+def daemonHandleRequest(State, Request):
+    op = Request.get('op')
+    if op=='load':
+        return daemonGet(State, Request['path'])['out']
+    elif op=='diff':
+        return daemonDiff(State, Request['prev'], Request['cur'])
+    elif op=='query':
+        return daemonQuery(State, Request)
+    elif op=='list':
+        with State['lock']:
+            return {path: Entry['Type'] for path, Entry in State['files'].items() if Entry['Type'] is not None}
+    raise ValueError("Unknown op: %s" % (op))
+
+class DaemonRequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for line in self.rfile:
+            if len(line.strip())==0:
+                continue
+            try:
+                Request = json.loads(line)
+                Response = json.dumps({'ok': True, 'result': daemonHandleRequest(self.server.State, Request)}, default=metaJsonDefault)
+            except Exception as e: # Every request must get a response line.
+                Response = json.dumps({'ok': False, 'error': "%s: %s" % (type(e).__name__, e)})
+            self.wfile.write(Response.encode('utf8') + b'\n')
+            self.wfile.flush()
+
+class DaemonServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+# The parsed state is only read (requests return JSON), hence the loads are interned for the lifetime of the daemon (see nx_intern).
+def daemonServe(SocketPath, Roots, PollInterval=5.0, UseInotify=True):
+    with InternScope():
+        State = daemonStateCreate(Roots)
+        daemonWatchStart(State, PollInterval, UseInotify)
+
+        if os.path.exists(SocketPath):
+            os.unlink(SocketPath)
+
+        with DaemonServer(SocketPath, DaemonRequestHandler) as server:
+            server.State = State
+            try:
+                server.serve_forever()
+            finally:
+                State['stop'].set()
+                os.unlink(SocketPath)
+
+def daemonRequest(SocketPath, Request):
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(SocketPath)
+        sock.sendall(json.dumps(Request).encode('utf8') + b'\n')
+        with sock.makefile('rb') as tmpf:
+            return json.loads(tmpf.readline())
+
+if __name__ == "__main__":
+    if len(sys.argv)>3 and sys.argv[1]=='serve':
+        PollInterval = 5.0
+        UseInotify = True
+        Roots = []
+        for arg in sys.argv[3:]:
+            if arg.startswith('--poll='):
+                PollInterval = float(arg[len('--poll='):])
+                UseInotify = False
+            else:
+                Roots.append(arg)
+        daemonServe(sys.argv[2], Roots, PollInterval, UseInotify)
+    elif len(sys.argv)>3 and sys.argv[1]=='request':
+        print(json.dumps(daemonRequest(sys.argv[2], json.loads(sys.argv[3])), indent=1))
+    else:
+        print("Usage:\n%s serve <socket path> <firmware dir>... [--poll=<seconds>]\n%s request <socket path> <JSON request>" % (sys.argv[0], sys.argv[0]))
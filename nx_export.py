@@ -0,0 +1,130 @@
+#!/usr/bin/python3
+import os
+import sys
+import numpy as np
+from nx_meta import metaLoad
+from nx_intern import InternScope
+
+# Columnar export of the KC descriptors, SAC entries, FAC owner records and BDF entries, one row each, for firmware-wide analysis with NumPy.
+# Each table is written as a directory with one .npy file per column, which are memory-mapped on load (.npz can't be memory-mapped).
+# String columns are dictionary-encoded: '<Column>.npy' contains int32 codes into '<Column>_strings.npy'.
+
+EXPORT_SCHEMA = {
+    'Kc': [('FirmwareVersion', 'str'), ('ProgramId', np.uint64), ('Name', 'str'), ('Kind', 'str'), ('Value', np.uint32), ('Value1', np.uint32), ('BeginAddress', np.uint64), ('Size', np.uint64)],
+    'Sac': [('FirmwareVersion', 'str'), ('ProgramId', np.uint64), ('Name', 'str'), ('IsServer', np.bool_), ('Service', 'str'), ('Value', np.uint8)],
+    'Fac': [('FirmwareVersion', 'str'), ('ProgramId', np.uint64), ('Name', 'str'), ('Kind', 'str'), ('OwnerId', np.uint64), ('Access', np.uint8)],
+    'Bdf': [('FirmwareVersion', 'str'), ('Store', 'str'), ('EntryId', np.uint32), ('Status', np.uint32), ('DataSize', np.uint32), ('DataOffset', np.uint32), ('Sha256', 'sha256')],
+}
+
+def exportTablesCreate():
+    return {Table: {Column: [] for Column, Type in Columns} for Table, Columns in EXPORT_SCHEMA.items()}
+
+def exportAddRow(Tables, Table, **Row):
+    for Column, Value in Row.items():
+        Tables[Table][Column].append(Value)
+
+def exportAddKc(Tables, FirmwareVersion, ProgramId, Name, Kc):
+    for KcEntry in Kc:
+        for KcKey, KcValue in KcEntry.items():
+            if KcKey=='MemoryMap':
+                exportAddRow(Tables, 'Kc', FirmwareVersion=FirmwareVersion, ProgramId=ProgramId, Name=Name, Kind=KcKey, Value=KcValue['Value0'], Value1=KcValue['Value1'], BeginAddress=KcValue['BeginAddress'], Size=KcValue['Size'])
+            elif KcKey=='IoMemoryMap':
+                exportAddRow(Tables, 'Kc', FirmwareVersion=FirmwareVersion, ProgramId=ProgramId, Name=Name, Kind=KcKey, Value=KcValue['Value'], Value1=0, BeginAddress=KcValue['BeginAddress'], Size=0x1000)
+            elif KcKey=='EnableSystemCalls' or KcKey=='EnableInterrupts':
+                for Desc in KcValue['Descriptors']:
+                    exportAddRow(Tables, 'Kc', FirmwareVersion=FirmwareVersion, ProgramId=ProgramId, Name=Name, Kind=KcKey, Value=Desc['Value'], Value1=0, BeginAddress=0, Size=0)
+            else:
+                exportAddRow(Tables, 'Kc', FirmwareVersion=FirmwareVersion, ProgramId=ProgramId, Name=Name, Kind=KcKey, Value=KcValue['Value'], Value1=0, BeginAddress=0, Size=0)
+
+def exportAddMeta(Tables, FirmwareVersion, Meta):
+    ProgramId = Meta['Aci']['ProgramId']
+    Name = Meta['Name']
+
+    exportAddKc(Tables, FirmwareVersion, ProgramId, Name, Meta['Aci']['Kc'])
+
+    for SacKey in ['Server', 'Client']:
+        for Service, Value in Meta['Aci']['Sac'][SacKey].items():
+            exportAddRow(Tables, 'Sac', FirmwareVersion=FirmwareVersion, ProgramId=ProgramId, Name=Name, IsServer=SacKey=='Server', Service=Service, Value=Value)
+
+    Fac = Meta['Aci']['Fac']
+    for Info in Fac['ContentOwnerInfo']:
+        exportAddRow(Tables, 'Fac', FirmwareVersion=FirmwareVersion, ProgramId=ProgramId, Name=Name, Kind='ContentOwnerInfo', OwnerId=Info['Id'], Access=0)
+    for Info in Fac['SaveDataOwnerInfo']:
+        exportAddRow(Tables, 'Fac', FirmwareVersion=FirmwareVersion, ProgramId=ProgramId, Name=Name, Kind='SaveDataOwnerInfo', OwnerId=Info['Id'], Access=Info['Access'])
+
+def exportAddBdf(Tables, FirmwareVersion, Store, Entries):
+    from ssl_bdf import bdf_fingerprint
+
+    for entry in Entries:
+        exportAddRow(Tables, 'Bdf', FirmwareVersion=FirmwareVersion, Store=Store, EntryId=entry['id'], Status=entry['status'], DataSize=entry['data_size'], DataOffset=entry['data_offset'], Sha256=bytes.fromhex(bdf_fingerprint(entry['data'])))
+
+# InPaths is a dict of FirmwareVersion -> list of paths, where paths ending with '.bdf' are loaded with bdf_read and the rest with metaLoad. The loads are interned (see nx_intern), since the parsed output is only read.
+def exportTablesBuild(InPaths):
+    Tables = exportTablesCreate()
+
+    with InternScope():
+        for FirmwareVersion, Paths in InPaths.items():
+            for path in Paths:
+                if path.endswith('.bdf'):
+                    from ssl_bdf import bdf_read
+
+                    Entries = bdf_read(path, load_x509=False)
+                    if Entries is not None:
+                        exportAddBdf(Tables, FirmwareVersion, os.path.basename(path), Entries)
+                    continue
+
+                Loaded = metaLoad(path)
+                if Loaded is None:
+                    print("exportTablesBuild(): Skipping %s since metaLoad failed." % (path))
+                elif 'Meta' in Loaded:
+                    exportAddMeta(Tables, FirmwareVersion, Loaded['Meta'])
+                elif 'Ini1' in Loaded:
+                    for Kip in Loaded['Ini1']['Kips']:
+                        exportAddKc(Tables, FirmwareVersion, Kip['ProgramId'], Kip['Name'], Kip['Kc'])
+
+    return Tables
+
+def exportTablesWrite(Tables, OutDir):
+    for Table, Columns in EXPORT_SCHEMA.items():
+        TableDir = os.path.join(OutDir, Table)
+        os.makedirs(TableDir, exist_ok=True)
+
+        for Column, Type in Columns:
+            Values = Tables[Table][Column]
+            if Type=='str':
+                Strings = sorted(set(Values))
+                Codes = {String: i for i, String in enumerate(Strings)}
+                np.save(os.path.join(TableDir, Column + '_strings.npy'), np.array(Strings, dtype=np.str_))
+                Array = np.fromiter((Codes[Value] for Value in Values), dtype=np.int32, count=len(Values))
+            elif Type=='sha256':
+                Array = np.frombuffer(b''.join(Values), dtype=np.uint8).reshape(len(Values), 0x20)
+            else:
+                Array = np.array(Values, dtype=Type)
+            np.save(os.path.join(TableDir, Column + '.npy'), Array)
+
+# Returns a dict of Table -> dict of Column -> memory-mapped array, with '<Column>_strings' for the string columns.
+def exportTablesLoad(InDir):
+    Tables = {}
+    for Table, Columns in EXPORT_SCHEMA.items():
+        TableDir = os.path.join(InDir, Table)
+        if os.path.exists(TableDir) is False:
+            print("exportTablesLoad(): Table doesn't exist: %s" % (TableDir))
+            return None
+
+        Tables[Table] = {}
+        for Column, Type in Columns:
+            Tables[Table][Column] = np.load(os.path.join(TableDir, Column + '.npy'), mmap_mode='r')
+            if Type=='str':
+                Tables[Table][Column + '_strings'] = np.load(os.path.join(TableDir, Column + '_strings.npy'))
+
+    return Tables
+
+if __name__ == "__main__":
+    if len(sys.argv)>2:
+        InPaths = {}
+        for arg in sys.argv[2:]:
+            FirmwareVersion, path = arg.split('=', 1)
+            InPaths.setdefault(FirmwareVersion, []).append(path)
+        exportTablesWrite(exportTablesBuild(InPaths), sys.argv[1])
+    else:
+        print("Usage:\n%s <output dir> <firmware version>=<NPDM/INI1/.bdf path>..." % (sys.argv[0]))
@@ -0,0 +1,80 @@
+#!/usr/bin/python3
+import threading
+from collections import OrderedDict
+
+# Interning for parsed sub-objects (FAC/SAC/KC, BDF entries): identical input bytes return the same parsed object, which is much more memory efficient when loading many firmware versions where most blocks are unchanged.
+# This also allows diffs to short-circuit when Prev/Cur are the same object.
+# Mutable output (the parsed dicts/lists) is only interned within an InternScope, since it's shared and must be treated as read-only: callers which modify the metaLoad/bdf_read output are unaffected outside of a scope.
+# The table is cleared once the last scope exits, hence mutable objects handed out within a scope are never returned again afterwards. Immutable output is always interned.
+# The table is keyed by the digest of the raw input bytes, and is bounded: the least-recently-used entries are evicted once internMax is reached.
+
+internTable = OrderedDict()
+internLock = threading.Lock()
+internMax = 0x10000
+internStats = {'Hits': 0, 'Misses': 0}
+internScopeCount = 0
+
+def internDigest(data):
+    import hashlib
+
+    return hashlib.blake2b(data, digest_size=0x10).digest()
+
+# Returns the interned object for (Kind, data), otherwise Loader() is used and the output is interned. When Loader returns None, the None is returned without interning it.
+# Outside of an InternScope this just returns Loader(), unless Immutable is set.
+def internGet(Kind, data, Loader, Immutable=False):
+    if internScopeCount==0 and Immutable is False:
+        return Loader()
+
+    key = (Kind, internDigest(data))
+
+    with internLock:
+        out = internTable.get(key)
+        if out is not None:
+            internTable.move_to_end(key)
+            internStats['Hits']+= 1
+            return out
+        internStats['Misses']+= 1
+
+    out = Loader()
+    if out is None or internMax==0:
+        return out
+
+    with internLock:
+        out = internTable.setdefault(key, out)
+        internTable.move_to_end(key)
+        while len(internTable) > internMax:
+            internTable.popitem(last=False)
+
+    return out
+
+def internSetMax(Max):
+    global internMax
+
+    with internLock:
+        internMax = Max
+        while len(internTable) > internMax:
+            internTable.popitem(last=False)
+
+def internClear():
+    with internLock:
+        internTable.clear()
+        internStats['Hits'] = 0
+        internStats['Misses'] = 0
+
+# Enables interning of mutable output while in use (nestable), for code which only reads the parsed output: with InternScope(): ...
+class InternScope:
+    def __enter__(self):
+        global internScopeCount
+
+        with internLock:
+            internScopeCount+= 1
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        global internScopeCount
+
+        with internLock:
+            internScopeCount-= 1
+            if internScopeCount==0:
+                internTable.clear()
+        return False
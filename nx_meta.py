@@ -1,9 +1,11 @@
 #!/usr/bin/python3
 import os
 import sys
+import mmap
 import struct
 import binascii
 from os.path import exists
+from nx_intern import internGet, InternScope
 
 # This is intended for use with other scripts (such as for diffing).
 
@@ -44,11 +46,11 @@ def metaFindListDictWithValue(CmpVal, Val, ValKey):
             break
     return Out
 
-def metaLoadFac(Fac, path):
+def metaDecodeFac(Fac, path):
     out = {}
 
     Version = Fac[0]
-    Padding = Fac[0x1:0x4]
+    Padding = bytes(Fac[0x1:0x4])
     FsAccessFlag = struct.unpack('<Q', Fac[0x4:0xC])[0]
     ContentOwnerInfoOffset, ContentOwnerInfoSize, SaveDataOwnerInfoOffset, SaveDataOwnerInfoSize = struct.unpack('<IIII', Fac[0xC:0x1C])
 
@@ -98,7 +100,7 @@ def metaLoadFac(Fac, path):
 
     return out
 
-def metaLoadSac(Sac): # This uses a dict, so any duplicate entries will overwrite the original entry.
+def metaDecodeSac(Sac): # This uses a dict, so any duplicate entries will overwrite the original entry.
     out = {'Server': {}, 'Client': {}}
 
     pos=0
@@ -107,7 +109,7 @@ def metaLoadSac(Sac): # This uses a dict, so any duplicate entries will overwrit
         size = (tmp&0x7)+1
         IsServer = tmp&0x80
 
-        serv = Sac[pos+1:pos+1+size].decode('utf8')
+        serv = bytes(Sac[pos+1:pos+1+size]).decode('utf8')
         if IsServer==0x80:
             out['Server'][serv] = tmp
         else:
@@ -117,6 +119,13 @@ def metaLoadSac(Sac): # This uses a dict, so any duplicate entries will overwrit
 
     return out
 
+# Within an InternScope (see nx_intern) the metaLoad{Fac/Sac/Kc} output is interned, hence it's shared between identical blocks and must not be modified.
+def metaLoadFac(Fac, path):
+    return internGet('Fac', Fac, lambda: metaDecodeFac(Fac, path))
+
+def metaLoadSac(Sac):
+    return internGet('Sac', Sac, lambda: metaDecodeSac(Sac))
+
 def CountSetBits(val, in_bitcount):
     bitcount=in_bitcount
     for i in range(in_bitcount):
@@ -125,7 +134,7 @@ def CountSetBits(val, in_bitcount):
             break
     return bitcount
 
-def metaLoadKc(Kc, path):
+def metaDecodeKc(Kc, path):
     out = []
     descriptors = []
 
@@ -244,6 +253,9 @@ def metaLoadKc(Kc, path):
 
     return out
 
+def metaLoadKc(Kc, path):
+    return internGet('Kc', Kc, lambda: metaDecodeKc(Kc, path))
+
 def metaGetNameLen(data):
     NameLen = len(data)
     DataLen = NameLen
@@ -254,88 +266,95 @@ def metaGetNameLen(data):
     return NameLen
 
 def metaLoad(path):
-    out = {}
     if os.path.exists(path) is False:
         print("metaLoad(): File doesn't exist: %s" % (path))
-        out = None
+        return None
+
+    with open(path, 'rb') as tmpf:
+        data = tmpf.read()
+
+    return metaLoadData(path, data)
+
+# data can be bytes or a memoryview, such as a view into a container mmap. path is only used for messages.
+def metaLoadData(path, data):
+    out = {}
+    magicnum = struct.unpack('<I', data[0x0:0x4])[0]
+    if magicnum!=0x4154454d:
+        if magicnum==0x31494e49: # INI1
+            return metaIni1Load(path, data)
+        elif len(data)>=0x200 and struct.unpack('<I', data[0x150:0x154])[0]==0x31324b50: # Decrypted Package2
+            return metaPackage2Ini1Load(path, data)
+        else:
+            print("Bad META magicnum (0x%x) for metaLoad('%s')." % (magicnum, path))
+            out = None
     else:
-        with open(path, 'rb') as tmpf:
-            data = tmpf.read()
-            magicnum = struct.unpack('<I', data[0x0:0x4])[0]
-            if magicnum!=0x4154454d:
-                if magicnum==0x31494e49: # INI1
-                    return metaIni1Load(path, data)
-                else:
-                    print("Bad META magicnum (0x%x) for metaLoad('%s')." % (magicnum, path))
-                    out = None
+        SignatureKeyGeneration, Reserved_x8, Flags, Reserved_xD, MainThreadPriority, MainThreadCoreNumber, Reserved_x10, SystemResourceSize, Version, MainThreadStackSize = struct.unpack('<IIBBBBIIII', data[0x4:0x20])
+        Name = bytes(data[0x20:0x20+0x10])
+        ProductCode = bytes(data[0x30:0x30+0x10])
+        Reserved_x40 = bytes(data[0x40:0x40+0x30])
+        AciOffset, AciSize, AcidOffset, AcidSize = struct.unpack('<IIII', data[0x70:0x80])
+
+        out['SignatureKeyGeneration'] = SignatureKeyGeneration
+        out['Reserved_x8'] = Reserved_x8
+        out['Flags'] = Flags
+        out['Reserved_xD'] = Reserved_xD
+        out['MainThreadPriority'] = MainThreadPriority
+        out['MainThreadCoreNumber'] = MainThreadCoreNumber
+        out['Reserved_x10'] = Reserved_x10
+        out['SystemResourceSize'] = SystemResourceSize
+        out['Version'] = Version
+        out['MainThreadStackSize'] = MainThreadStackSize
+
+        namelen = metaGetNameLen(Name)
+        out['Name'] = Name[:namelen].decode('utf8')
+        out['ProductCode'] = ProductCode
+        out['Reserved_x40'] = Reserved_x40
+
+        metasize = len(data)
+        if (AciOffset>=metasize or AciOffset+AciSize>metasize) or (AcidOffset>=metasize or AcidOffset+AcidSize>metasize):
+            print("Invalid Aci/Acid offset/size for metaLoad('%s')." % (path))
+            out = None
+        else:
+            Aci = data[AciOffset:AciOffset+AciSize]
+            Acid = data[AcidOffset:AcidOffset+AcidSize]
+
+            magicnum, Size, Version, Unk_x209, Reserved_x20A, Reserved_x20B, Flags, ProgramIdMin, ProgramIdMax = struct.unpack('<IIBBBBIQQ', Acid[0x200:0x220])
+            Reserved_x238, Reserved_x23C = struct.unpack('<II', Acid[0x238:0x240])
+
+            if magicnum!=0x44494341:
+                print("Bad ACID magicnum (0x%x) for metaLoad('%s')." % (magicnum, path))
+                out = None
             else:
-                SignatureKeyGeneration, Reserved_x8, Flags, Reserved_xD, MainThreadPriority, MainThreadCoreNumber, Reserved_x10, SystemResourceSize, Version, MainThreadStackSize = struct.unpack('<IIBBBBIIII', data[0x4:0x20])
-                Name = data[0x20:0x20+0x10]
-                ProductCode = data[0x30:0x30+0x10]
-                Reserved_x40 = data[0x40:0x40+0x30]
-                AciOffset, AciSize, AcidOffset, AcidSize = struct.unpack('<IIII', data[0x70:0x80])
-
-                out['SignatureKeyGeneration'] = SignatureKeyGeneration
-                out['Reserved_x8'] = Reserved_x8
-                out['Flags'] = Flags
-                out['Reserved_xD'] = Reserved_xD
-                out['MainThreadPriority'] = MainThreadPriority
-                out['MainThreadCoreNumber'] = MainThreadCoreNumber
-                out['Reserved_x10'] = Reserved_x10
-                out['SystemResourceSize'] = SystemResourceSize
-                out['Version'] = Version
-                out['MainThreadStackSize'] = MainThreadStackSize
-
-                namelen = metaGetNameLen(Name)
-                out['Name'] = Name[:namelen].decode('utf8')
-                out['ProductCode'] = ProductCode
-                out['Reserved_x40'] = Reserved_x40
-
-                metasize = len(data)
-                if (AciOffset>=metasize or AciOffset+AciSize>metasize) or (AcidOffset>=metasize or AcidOffset+AcidSize>metasize):
-                    print("Invalid Aci/Acid offset/size for metaLoad('%s')." % (path))
+                out['Acid'] = {'Version': Version, 'Unk_x209': Unk_x209, 'Reserved_x20A': Reserved_x20A, 'Reserved_x20B': Reserved_x20B, 'Flags': Flags, 'ProgramIdMin': ProgramIdMin, 'ProgramIdMax': ProgramIdMax}
+
+                magicnum, Reserved_x4, Reserved_x8, Reserved_xC, ProgramId, Reserved_x18, Reserved_x1C = struct.unpack('<IIIIQII', Aci[0x0:0x20])
+                FacOffset, FacSize, SacOffset, SacSize, KcOffset, KcSize = struct.unpack('<IIIIII', Aci[0x20:0x38])
+                Reserved_x38, Reserved_x3C = struct.unpack('<II', Aci[0x38:0x40])
+
+                if magicnum!=0x30494341:
+                    print("Bad ACI0 magicnum (0x%x) for metaLoad('%s')." % (magicnum, path))
                     out = None
                 else:
-                    Aci = data[AciOffset:AciOffset+AciSize]
-                    Acid = data[AcidOffset:AcidOffset+AcidSize]
+                    out['Aci'] = {'Reserved_x4': Reserved_x4, 'Reserved_x8': Reserved_x8, 'Reserved_xC': Reserved_xC, 'ProgramId': ProgramId, 'Reserved_x18': Reserved_x18, 'Reserved_x1C': Reserved_x1C, 'Reserved_x38': Reserved_x38, 'Reserved_x3C': Reserved_x3C}
 
-                    magicnum, Size, Version, Unk_x209, Reserved_x20A, Reserved_x20B, Flags, ProgramIdMin, ProgramIdMax = struct.unpack('<IIBBBBIQQ', Acid[0x200:0x220])
-                    Reserved_x238, Reserved_x23C = struct.unpack('<II', Acid[0x238:0x240])
-
-                    if magicnum!=0x44494341:
-                        print("Bad ACID magicnum (0x%x) for metaLoad('%s')." % (magicnum, path))
+                    if (FacOffset>=AciSize or FacOffset+FacSize>AciSize) or (SacOffset>=AciSize or SacOffset+SacSize>AciSize) or (KcOffset>=AciSize or KcOffset+KcSize>AciSize) or (KcSize&0x3):
+                        print("Invalid data offset/size within ACID for metaLoad('%s')." % (path))
                         out = None
                     else:
-                        out['Acid'] = {'Version': Version, 'Unk_x209': Unk_x209, 'Reserved_x20A': Reserved_x20A, 'Reserved_x20B': Reserved_x20B, 'Flags': Flags, 'ProgramIdMin': ProgramIdMin, 'ProgramIdMax': ProgramIdMax}
-
-                        magicnum, Reserved_x4, Reserved_x8, Reserved_xC, ProgramId, Reserved_x18, Reserved_x1C = struct.unpack('<IIIIQII', Aci[0x0:0x20])
-                        FacOffset, FacSize, SacOffset, SacSize, KcOffset, KcSize = struct.unpack('<IIIIII', Aci[0x20:0x38])
-                        Reserved_x38, Reserved_x3C = struct.unpack('<II', Aci[0x38:0x40])
+                        Fac = Aci[FacOffset:FacOffset+FacSize]
+                        Sac = Aci[SacOffset:SacOffset+SacSize]
+                        Kc = Aci[KcOffset:KcOffset+KcSize]
 
-                        if magicnum!=0x30494341:
-                            print("Bad ACI0 magicnum (0x%x) for metaLoad('%s')." % (magicnum, path))
+                        Fac = metaLoadFac(Fac, path)
+                        if Fac is None:
                             out = None
                         else:
-                            out['Aci'] = {'Reserved_x4': Reserved_x4, 'Reserved_x8': Reserved_x8, 'Reserved_xC': Reserved_xC, 'ProgramId': ProgramId, 'Reserved_x18': Reserved_x18, 'Reserved_x1C': Reserved_x1C, 'Reserved_x38': Reserved_x38, 'Reserved_x3C': Reserved_x3C}
-
-                            if (FacOffset>=AciSize or FacOffset+FacSize>AciSize) or (SacOffset>=AciSize or SacOffset+SacSize>AciSize) or (KcOffset>=AciSize or KcOffset+KcSize>AciSize) or (KcSize&0x3):
-                                print("Invalid data offset/size within ACID for metaLoad('%s')." % (path))
-                                out = None
-                            else:
-                                Fac = Aci[FacOffset:FacOffset+FacSize]
-                                Sac = Aci[SacOffset:SacOffset+SacSize]
-                                Kc = Aci[KcOffset:KcOffset+KcSize]
-
-                                Fac = metaLoadFac(Fac, path)
-                                if Fac is None:
-                                    out = None
-                                else:
-                                    Sac = metaLoadSac(Sac)
-                                    Kc = metaLoadKc(Kc, path)
+                            Sac = metaLoadSac(Sac)
+                            Kc = metaLoadKc(Kc, path)
 
-                                    out['Aci']['Fac'] = Fac
-                                    out['Aci']['Sac'] = Sac
-                                    out['Aci']['Kc'] = Kc
+                            out['Aci']['Fac'] = Fac
+                            out['Aci']['Sac'] = Sac
+                            out['Aci']['Kc'] = Kc
 
     if out is not None:
         out = {'Meta': out}
@@ -358,7 +377,7 @@ def metaIni1Load(path, data):
         pos=0x10
         for KipIndex in range(KipsCount):
             if datalen < pos+0x100:
-                print("Input file data is too small for metaIni1Load('%s'), KipIndex=%d." % (KipIndex))
+                print("Input file data is too small for metaIni1Load('%s'), KipIndex=%d." % (path, KipIndex))
                 out = None
                 break
 
@@ -370,7 +389,7 @@ def metaIni1Load(path, data):
 
             Kip = {}
 
-            Name = data[pos+0x4:pos+0x10]
+            Name = bytes(data[pos+0x4:pos+0x10])
 
             ProgramId, Version, MainThreadPriority, MainThreadCoreNumber, Reserved_x1E, Flags = struct.unpack('<QIBBBB', data[pos+0x10:pos+0x20])
 
@@ -422,6 +441,191 @@ def metaIni1Load(path, data):
         out = {'Ini1': out}
     return out
 
+def metaProbeRead(tmpf, buf, offset, size):
+    tmpf.seek(offset)
+    view = memoryview(buf)[:size]
+    if tmpf.readinto(view)!=size:
+        return None
+    return view
+
+# Only reads the header fields needed for identifying the file: Name, ProgramId and Version, via the specified fixed-size buffer (allocated when not specified). For INI1 only the KIP headers are read.
+def metaProbe(path, buf=None):
+    if buf is None:
+        buf = bytearray(0x80)
+
+    out = None
+    try:
+        tmpf = open(path, 'rb', buffering=0)
+    except OSError:
+        print("metaProbe(): Failed to open file: %s" % (path))
+        return None
+
+    with tmpf:
+        # Single read of up to 0x80 bytes (no seek since the file was just opened), where a short read is allowed: the INI1 header is only 0x10 bytes, while the META header is 0x80 bytes.
+        data = memoryview(buf)[:0x80]
+        datalen = tmpf.readinto(data)
+        if datalen < 0x10:
+            print("metaProbe(): File is too small: %s" % (path))
+            return None
+
+        magicnum = struct.unpack_from('<I', data, 0x0)[0]
+        if magicnum==0x4154454d:
+            if datalen < 0x80:
+                print("metaProbe(): File is too small: %s" % (path))
+                return None
+
+            Version = struct.unpack_from('<I', data, 0x18)[0]
+            NameLen = metaGetNameLen(data[0x20:0x30])
+            Name = bytes(data[0x20:0x20+NameLen]).decode('utf8')
+            AciOffset, AciSize = struct.unpack_from('<II', data, 0x70)
+
+            if AciSize<0x20:
+                print("Invalid Aci offset/size for metaProbe('%s')." % (path))
+                return None
+
+            data = metaProbeRead(tmpf, buf, AciOffset, 0x18)
+            if data is None:
+                print("Invalid Aci offset/size for metaProbe('%s')." % (path))
+                return None
+            magicnum = struct.unpack_from('<I', data, 0x0)[0]
+            if magicnum!=0x30494341:
+                print("Bad ACI0 magicnum (0x%x) for metaProbe('%s')." % (magicnum, path))
+                return None
+            ProgramId = struct.unpack_from('<Q', data, 0x10)[0]
+
+            out = {'Type': 'Meta', 'Name': Name, 'ProgramId': ProgramId, 'Version': Version}
+        elif magicnum==0x31494e49: # INI1
+            KipsCount = struct.unpack_from('<I', data, 0x8)[0]
+            out = {'Type': 'Ini1', 'Kips': []}
+
+            pos=0x10
+            for KipIndex in range(KipsCount):
+                data = metaProbeRead(tmpf, buf, pos, 0x50)
+                if data is None:
+                    print("Input file data is too small for metaProbe('%s'), KipIndex=%d." % (path, KipIndex))
+                    return None
+
+                magicnum = struct.unpack_from('<I', data, 0x0)[0]
+                if magicnum!=0x3150494b:
+                    print("Bad KIP1 magicnum (0x%x) for metaProbe('%s')." % (magicnum, path))
+                    return None
+
+                NameLen = metaGetNameLen(data[0x4:0x10])
+                Name = bytes(data[0x4:0x4+NameLen]).decode('utf8')
+                ProgramId, Version = struct.unpack_from('<QI', data, 0x10)
+                TextBinSize = struct.unpack_from('<I', data, 0x28)[0]
+                RoBinSize = struct.unpack_from('<I', data, 0x38)[0]
+                DataBinSize = struct.unpack_from('<I', data, 0x48)[0]
+
+                out['Kips'].append({'Name': Name, 'ProgramId': ProgramId, 'Version': Version})
+                pos=pos+0x100+TextBinSize+RoBinSize+DataBinSize
+        else:
+            print("Bad magicnum (0x%x) for metaProbe('%s')." % (magicnum, path))
+
+    return out
+
+def metaProbePathArray(InPaths):
+    out = {}
+    buf = bytearray(0x80)
+
+    for path in InPaths:
+        tmp = metaProbe(path, buf)
+        if tmp is not None:
+            out[path] = tmp
+
+    return out
+
+def metaPackage2Parse(path, data):
+    if len(data) < 0x200:
+        print("Input file data is too small for metaPackage2Parse('%s')." % (path))
+        return None
+
+    magicnum, BaseOffset, Reserved_x158, VersionMax, VersionMin, Reserved_x15E = struct.unpack('<IIIBBH', data[0x150:0x160])
+    if magicnum!=0x31324b50:
+        print("Bad PK21 magicnum (0x%x) for metaPackage2Parse('%s'), the image must be decrypted." % (magicnum, path))
+        return None
+
+    SectionSizes = struct.unpack('<IIII', data[0x160:0x170])
+    SectionOffsets = struct.unpack('<IIII', data[0x170:0x180])
+
+    out = {'BaseOffset': BaseOffset, 'VersionMax': VersionMax, 'VersionMin': VersionMin, 'Sections': []}
+
+    # The sections are stored consecutively following the 0x200-byte header, the header offsets are load offsets.
+    pos=0x200
+    for i in range(4):
+        if pos+SectionSizes[i] > len(data):
+            print("Section %d offset/size is invalid for metaPackage2Parse('%s')." % (i, path))
+            return None
+        out['Sections'].append({'Offset': SectionOffsets[i], 'Size': SectionSizes[i], 'DataOffset': pos})
+        pos=pos+SectionSizes[i]
+
+    return out
+
+def metaPackage2Ini1IsValid(data, pos, end):
+    if pos+0x14 > end:
+        return False
+    Size, KipsCount = struct.unpack('<II', data[pos+0x4:pos+0xC])
+    if Size<0x10 or pos+Size > end or KipsCount==0:
+        return False
+    return struct.unpack('<I', data[pos+0x10:pos+0x14])[0]==0x3150494b
+
+# Returns (offset, size) for the INI1 within the Package2 data, or None. Pre-8.0.0 INI1 is section 1, while with 8.0.0+ it's embedded in the kernel section, where the offset differs between versions. Hence the kernel section is searched for a valid INI1 header.
+def metaPackage2FindIni1(data, Package2):
+    import re
+
+    Section = Package2['Sections'][1]
+    if Section['Size']!=0:
+        return (Section['DataOffset'], Section['Size'])
+
+    Section = Package2['Sections'][0]
+    start = Section['DataOffset']
+    end = start+Section['Size']
+    for match in re.finditer(b'INI1', data[start:end]):
+        pos = start+match.start()
+        if pos & 0x3:
+            continue
+        if metaPackage2Ini1IsValid(data, pos, end):
+            return (pos, struct.unpack('<I', data[pos+0x4:pos+0x8])[0])
+
+    return None
+
+# data can be bytes, a memoryview or a mmap: only a memoryview of the INI1 is passed to metaIni1Load, the INI1 isn't copied.
+def metaPackage2Ini1Load(path, data):
+    view = memoryview(data)
+    with view:
+        Package2 = metaPackage2Parse(path, view)
+        if Package2 is None:
+            return None
+
+        Ini1Pos = metaPackage2FindIni1(view, Package2)
+        if Ini1Pos is None:
+            print("metaPackage2Ini1Load('%s'): INI1 not found." % (path))
+            return None
+
+        Ini1Offset, Ini1Size = Ini1Pos
+        with view[Ini1Offset:Ini1Offset+Ini1Size] as Ini1:
+            return metaIni1Load(path, Ini1)
+
+def metaPackage2Load(path):
+    if os.path.exists(path) is False:
+        print("metaPackage2Load(): File doesn't exist: %s" % (path))
+        return None
+
+    with open(path, 'rb') as tmpf:
+        if os.fstat(tmpf.fileno()).st_size < 0x200:
+            print("Input file data is too small for metaPackage2Load('%s')." % (path))
+            return None
+        with mmap.mmap(tmpf.fileno(), 0, access=mmap.ACCESS_READ) as tmpmap:
+            return metaPackage2Ini1Load(path, tmpmap)
+
+def metaProbePrint(InProbes):
+    for path, out in InProbes.items():
+        if out['Type']=='Meta':
+            print("%s: Meta %016X %s v%d" % (path, out['ProgramId'], out['Name'], out['Version']))
+        else:
+            for Kip in out['Kips']:
+                print("%s: Ini1 %016X %s v%d" % (path, Kip['ProgramId'], Kip['Name'], Kip['Version']))
+
 def metaDiffSac(Out, Prev, Cur, SacKey):
     for TmpKey, TmpValue in Cur['Aci']['Sac'][SacKey].items():
         if TmpKey in Prev['Aci']['Sac'][SacKey]:
@@ -483,7 +687,7 @@ def metaKcToDict(Kc):
 def metaDiffKc(Prev, Cur):
     Out = {}
 
-    if Prev==Cur:
+    if Prev is Cur or Prev==Cur:
         return Out
 
     MemoryMapUpdated = {'Descriptors': []}
@@ -687,7 +891,7 @@ def metaDiff(Prev, Cur):
                             if AciKey not in Out[Key]:
                                 Out[Key][AciKey] = {}
                             Out[Key][AciKey]['Updated'] = (Prev[Key][AciKey], AciValue)
-                    elif AciKey=='Fac' and 'Fac' in Prev[Key]:
+                    elif AciKey=='Fac' and 'Fac' in Prev[Key] and AciValue is not Prev[Key][AciKey]:
                         for FacKey, FacValue in Cur[Key][AciKey].items():
                             FacValuePrev = Prev[Key][AciKey][FacKey]
                             if FacValuePrev != FacValue:
@@ -742,7 +946,7 @@ def metaDiff(Prev, Cur):
                                             Out[Key][AciKey][FacKey]['Added'] = InfoAdded
                                         if InfoRemovedLen>0:
                                             Out[Key][AciKey][FacKey]['Removed'] = InfoRemoved
-                    elif AciKey=='Sac' and 'Sac' in Prev['Aci']:
+                    elif AciKey=='Sac' and 'Sac' in Prev['Aci'] and AciValue is not Prev['Aci'][AciKey]:
                         metaDiffSac(Out, Prev, Cur, 'Server')
                         metaDiffSac(Out, Prev, Cur, 'Client')
                     elif AciKey=='Kc' and 'Kc' in Prev['Aci']:
@@ -819,29 +1023,50 @@ def metaDiffIni1(Prev, Cur):
 
     return {'Ini1': Out}
 
+# Diffs the metaLoad output for Prev/Cur, returns None when the diff was skipped.
+def metaDiffLoaded(Id, Prev, Cur):
+    if Prev is None or Cur is None:
+        print("metaDiffPathArray(): Skipping diff for %s since loading Prev/Cur failed." % (Id))
+        return None
+
+    if 'Meta' in Prev and 'Meta' in Cur:
+        return metaDiff(Prev['Meta'], Cur['Meta'])
+    elif 'Ini1' in Prev and 'Ini1' in Cur:
+        return metaDiffIni1(Prev['Ini1'], Cur['Ini1'])
+
+    print("metaDiffPathArray(): Skipping diff for %s since the required data was not specified." % (Id))
+    return None
+
+# The loads are interned (see nx_intern), hence the parsed objects in the output can be shared between Ids.
 def metaDiffPathArray(InPaths):
     out = {}
 
-    for Id, Paths in InPaths.items():
-        Prev = metaLoad(Paths['Prev'])
-        Cur = metaLoad(Paths['Cur'])
+    with InternScope():
+        for Id, Paths in InPaths.items():
+            Prev = metaLoad(Paths['Prev'])
+            Cur = metaLoad(Paths['Cur'])
 
-        if Prev is None or Cur is None:
-            print("metaDiffPathArray(): Skipping diff for %s since loading Prev/Cur failed." % (Id))
-        else:
-            if 'Meta' in Prev and 'Meta' in Cur:
-                tmp = metaDiff(Prev['Meta'], Cur['Meta'])
-            elif 'Ini1' in Prev and 'Ini1' in Cur:
-                tmp = metaDiffIni1(Prev['Ini1'], Cur['Ini1'])
-            else:
-                print("metaDiffPathArray(): Skipping diff for %s since the required data was not specified." % (Id))
-                continue
-            out[Id] = tmp
+            tmp = metaDiffLoaded(Id, Prev, Cur)
+            if tmp is not None:
+                out[Id] = tmp
 
     return out
 
+# For json.dumps(): bytes are converted to hex strings, and the x509 certificates/datetimes from ssl_bdf are converted to strings.
+def metaJsonDefault(obj):
+    if isinstance(obj, (bytes, bytearray, memoryview)):
+        return bytes(obj).hex()
+    elif isinstance(obj, (set, frozenset)):
+        return sorted(obj)
+    elif hasattr(obj, 'isoformat'): # datetime
+        return obj.isoformat()
+    elif hasattr(obj, 'fingerprint') and hasattr(obj, 'subject'): # x509.Certificate
+        return {'subject': obj.subject.rfc4514_string(), 'issuer': obj.issuer.rfc4514_string(), 'serial_number': '0x%X' % (obj.serial_number)}
+    return str(obj)
+
 if __name__ == "__main__":
-    if len(sys.argv)>1:
+    if len(sys.argv)>2 and sys.argv[1]=='--probe':
+        metaProbePrint(metaProbePathArray(sys.argv[2:]))
+    elif len(sys.argv)>1:
         out = metaLoad(sys.argv[1])
         print(out)
-
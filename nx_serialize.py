@@ -0,0 +1,594 @@
+#!/usr/bin/python3
+import sys
+import struct
+from nx_meta import metaLoadData, metaIni1Load, metaLoadFac, metaLoadSac, metaLoadKc
+
+# Serializers for the metaLoad/metaIni1Load/bdf_read output, for generating round-trip and mutation corpora.
+# Data which isn't represented in the parsed output (ACID signature/key/ACID FAC/SAC/KC, KIP sections) is copied from Base when specified, otherwise it's zero/empty.
+# The parsed KC/SAC don't preserve the descriptor/entry order or the KC padding, hence with Base the raw FAC/SAC/KC is copied from Base when it parses to the same block, and the block order/offsets are taken from Base. Hence serialize(parse(data), data) is byte-exact.
+# Without Base (or for blocks which changed) a canonical layout is used: ACI0 at 0x80 followed by ACID, FAC/SAC/KC in that order, blocks aligned to 0x10, SAC Server entries first.
+# The serializePatch* functions instead rewrite individual fields in-place in a bytearray, which is much faster for generating many variants of the same file.
+
+def serializeAlign(val, align):
+    return (val + align-1) & ~(align-1)
+
+def serializeFac(Fac):
+    ContentOwnerInfo = b''
+    ContentOwnerInfoOffset = 0
+    if len(Fac['ContentOwnerInfo'])>0:
+        ContentOwnerInfoOffset = 0x1C
+        ContentOwnerInfo = struct.pack('<I%dQ' % (len(Fac['ContentOwnerInfo'])), len(Fac['ContentOwnerInfo']), *[Info['Id'] for Info in Fac['ContentOwnerInfo']])
+
+    SaveDataOwnerInfo = b''
+    SaveDataOwnerInfoOffset = 0
+    if len(Fac['SaveDataOwnerInfo'])>0:
+        SaveDataOwnerInfoOffset = 0x1C + len(ContentOwnerInfo)
+        Count = len(Fac['SaveDataOwnerInfo'])
+        SaveDataOwnerInfo = struct.pack('<I', Count) + bytes([Info['Access'] for Info in Fac['SaveDataOwnerInfo']])
+        # The Ids are aligned to 0x4 relative to the start of the FAC.
+        Pos = SaveDataOwnerInfoOffset + len(SaveDataOwnerInfo)
+        SaveDataOwnerInfo+= bytes(serializeAlign(Pos, 0x4) - Pos)
+        SaveDataOwnerInfo+= struct.pack('<%dQ' % (Count), *[Info['Id'] for Info in Fac['SaveDataOwnerInfo']])
+
+    return struct.pack('<B3sQIIII', Fac['Version'], Fac['Padding'], Fac['FsAccessFlag'], ContentOwnerInfoOffset, len(ContentOwnerInfo), SaveDataOwnerInfoOffset, len(SaveDataOwnerInfo)) + ContentOwnerInfo + SaveDataOwnerInfo
+
+def serializeSac(Sac):
+    out = bytearray()
+    for SacKey in ['Server', 'Client']:
+        for Name, Value in Sac[SacKey].items():
+            Name = Name.encode('utf8')
+            if len(Name)!=(Value&0x7)+1:
+                print("serializeSac(): The length of %s doesn't match the control byte 0x%02X." % (Name, Value))
+                return None
+            out.append(Value)
+            out+= Name
+    return bytes(out)
+
+def serializeKcValues(Kc):
+    Values = []
+    for KcEntry in Kc:
+        for KcKey, KcValue in KcEntry.items():
+            if KcKey=='MemoryMap':
+                Values.append(KcValue['Value0'])
+                Values.append(KcValue['Value1'])
+            elif KcKey=='EnableSystemCalls' or KcKey=='EnableInterrupts':
+                for Desc in KcValue['Descriptors']:
+                    Values.append(Desc['Value'])
+            else:
+                Values.append(KcValue['Value'])
+    return Values
+
+def serializeKc(Kc):
+    Values = serializeKcValues(Kc)
+    return struct.pack('<%dI' % (len(Values)), *Values)
+
+# Returns the raw BaseBlock when it parses to the same block, otherwise the block is serialized.
+def serializeBlock(Block, BaseBlock, Loader, Serializer):
+    if BaseBlock is not None:
+        tmp = Loader(bytes(BaseBlock))
+        if tmp is Block or tmp==Block:
+            return bytes(BaseBlock)
+    return Serializer(Block)
+
+# Blocks is a list of (Key, BaseOffset, Size) in the output order. Each block is placed at BaseOffset when specified and when it doesn't overlap the previous block, otherwise it follows the previous block aligned to 0x10. Returns a dict of Key -> Offset.
+def serializePlaceBlocks(Blocks, Start):
+    out = {}
+    pos = Start
+    for Key, BaseOffset, Size in Blocks:
+        Offset = serializeAlign(pos, 0x10)
+        if BaseOffset is not None and BaseOffset>=pos:
+            Offset = BaseOffset
+        out[Key] = Offset
+        pos = Offset+Size
+    return out
+
+# Meta is the 'Meta' from the metaLoad output. When Base (original NPDM data) is specified, the ACID is copied from it, and the Base layout and raw FAC/SAC/KC are used where possible.
+def serializeMeta(Meta, Base=None):
+    Aci = Meta['Aci']
+    BaseLayout = None
+    BaseBlocks = {'Fac': None, 'Sac': None, 'Kc': None}
+    if Base is not None:
+        BaseLayout = serializeMetaLayout(Base)
+        for Key in BaseBlocks:
+            BaseBlocks[Key] = Base[BaseLayout[Key]:BaseLayout[Key]+BaseLayout[Key+'Size']]
+
+    Blocks = {}
+    Blocks['Fac'] = serializeBlock(Aci['Fac'], BaseBlocks['Fac'], lambda data: metaLoadFac(data, 'serializeMeta'), serializeFac)
+    Blocks['Sac'] = serializeBlock(Aci['Sac'], BaseBlocks['Sac'], metaLoadSac, serializeSac)
+    Blocks['Kc'] = serializeBlock(Aci['Kc'], BaseBlocks['Kc'], lambda data: metaLoadKc(data, 'serializeMeta'), serializeKc)
+    if Blocks['Sac'] is None:
+        return None
+
+    Name = Meta['Name'].encode('utf8')
+    if len(Name)>0x10:
+        print("serializeMeta(): Name is too long: %s" % (Meta['Name']))
+        return None
+
+    if BaseLayout is not None:
+        AciBlocks = sorted([(Key, BaseLayout[Key]-BaseLayout['Aci'], len(Blocks[Key])) for Key in Blocks], key=lambda Block: (Block[1], Block[2]))
+    else:
+        AciBlocks = [(Key, None, len(Blocks[Key])) for Key in Blocks]
+    Offsets = serializePlaceBlocks(AciBlocks, 0x40)
+    # The block offsets must be within the ACI, including empty blocks.
+    AciSize = max([Offsets[Key]+max(len(Blocks[Key]), 1) for Key in Blocks])
+
+    # When the ACI layout is unchanged the Base ACI is used as-is, so that the padding is preserved.
+    if BaseLayout is not None and all([Offsets[Key]==BaseLayout[Key]-BaseLayout['Aci'] and len(Blocks[Key])==BaseLayout[Key+'Size'] for Key in Blocks]):
+        AciData = bytearray(Base[BaseLayout['Aci']:BaseLayout['Aci']+BaseLayout['AciSize']])
+    else:
+        AciData = bytearray(AciSize)
+
+    struct.pack_into('<IIIIQII', AciData, 0x0, 0x30494341, Aci['Reserved_x4'], Aci['Reserved_x8'], Aci['Reserved_xC'], Aci['ProgramId'], Aci['Reserved_x18'], Aci['Reserved_x1C'])
+    struct.pack_into('<IIIIIIII', AciData, 0x20, Offsets['Fac'], len(Blocks['Fac']), Offsets['Sac'], len(Blocks['Sac']), Offsets['Kc'], len(Blocks['Kc']), Aci['Reserved_x38'], Aci['Reserved_x3C'])
+    for Key, Block in Blocks.items():
+        AciData[Offsets[Key]:Offsets[Key]+len(Block)] = Block
+
+    if BaseLayout is not None:
+        AcidData = bytearray(Base[BaseLayout['Acid']:BaseLayout['Acid']+BaseLayout['AcidSize']])
+        AcidDataSize, = struct.unpack_from('<I', AcidData, 0x204)
+        Reserved_x238, Reserved_x23C = struct.unpack_from('<II', AcidData, 0x238)
+    else:
+        AcidData = bytearray(0x240)
+        AcidDataSize = len(AcidData)-0x100
+        Reserved_x238, Reserved_x23C = (0, 0)
+
+    Acid = Meta['Acid']
+    struct.pack_into('<IIBBBBIQQ', AcidData, 0x200, 0x44494341, AcidDataSize, Acid['Version'], Acid['Unk_x209'], Acid['Reserved_x20A'], Acid['Reserved_x20B'], Acid['Flags'], Acid['ProgramIdMin'], Acid['ProgramIdMax'])
+    struct.pack_into('<II', AcidData, 0x238, Reserved_x238, Reserved_x23C)
+
+    if BaseLayout is not None:
+        MetaBlocks = sorted([('Aci', BaseLayout['Aci'], len(AciData)), ('Acid', BaseLayout['Acid'], len(AcidData))], key=lambda Block: Block[1])
+    else:
+        MetaBlocks = [('Aci', None, len(AciData)), ('Acid', None, len(AcidData))]
+    Offsets = serializePlaceBlocks(MetaBlocks, 0x80)
+    Size = max(Offsets['Aci']+len(AciData), Offsets['Acid']+len(AcidData))
+
+    if BaseLayout is not None and Offsets['Aci']==BaseLayout['Aci'] and Offsets['Acid']==BaseLayout['Acid'] and len(AciData)==BaseLayout['AciSize'] and Size<=len(Base):
+        out = bytearray(Base)
+    else:
+        out = bytearray(Size)
+
+    struct.pack_into('<IIIBBBBIIII', out, 0x0, 0x4154454d, Meta['SignatureKeyGeneration'], Meta['Reserved_x8'], Meta['Flags'], Meta['Reserved_xD'], Meta['MainThreadPriority'], Meta['MainThreadCoreNumber'], Meta['Reserved_x10'], Meta['SystemResourceSize'], Meta['Version'], Meta['MainThreadStackSize'])
+    struct.pack_into('<16s16s48sIIII', out, 0x20, Name, Meta['ProductCode'], Meta['Reserved_x40'], Offsets['Aci'], len(AciData), Offsets['Acid'], len(AcidData))
+    out[Offsets['Aci']:Offsets['Aci']+len(AciData)] = AciData
+    out[Offsets['Acid']:Offsets['Acid']+len(AcidData)] = AcidData
+    return out
+
+# Returns a list of (offset, size) for each KIP in the INI1 data.
+def serializeIni1Layout(data):
+    out = []
+    KipsCount, = struct.unpack_from('<I', data, 0x8)
+    pos=0x10
+    for KipIndex in range(KipsCount):
+        TextBinSize, = struct.unpack_from('<I', data, pos+0x28)
+        RoBinSize, = struct.unpack_from('<I', data, pos+0x38)
+        DataBinSize, = struct.unpack_from('<I', data, pos+0x48)
+        Size = 0x100+TextBinSize+RoBinSize+DataBinSize
+        out.append((pos, Size))
+        pos=pos+Size
+    return out
+
+# Ini1 is the 'Ini1' from the metaIni1Load output, the Size field is written as specified. When Base (original INI1 data) is specified, the KIP section headers and section data are copied from it.
+def serializeIni1(Ini1, Base=None):
+    Kips = Ini1['Kips']
+
+    BaseLayout = None
+    if Base is not None:
+        BaseLayout = serializeIni1Layout(Base)
+        if len(BaseLayout)!=len(Kips):
+            print("serializeIni1(): The Base KIP count (%d) doesn't match (%d)." % (len(BaseLayout), len(Kips)))
+            return None
+
+    out = bytearray(struct.pack('<IIII', 0x31494e49, Ini1['Size'], len(Kips), Ini1['Reserved_xC']))
+    for KipIndex, Kip in enumerate(Kips):
+        if BaseLayout is not None:
+            Offset, Size = BaseLayout[KipIndex]
+            KipData = bytearray(Base[Offset:Offset+Size])
+        else:
+            KipData = bytearray(0x100)
+
+        Name = Kip['Name'].encode('utf8')
+        if len(Name)>0xC:
+            print("serializeIni1(): Name is too long for KIP %d." % (KipIndex))
+            return None
+
+        # The Base KC is kept when it parses to the same KC, since the descriptor order/padding isn't preserved in the parsed KC.
+        Kc = None
+        if BaseLayout is not None:
+            tmp = metaLoadKc(bytes(KipData[0x80:0x100]), 'serializeIni1')
+            if tmp is Kip['Kc'] or tmp==Kip['Kc']:
+                Kc = struct.unpack_from('<32I', KipData, 0x80)
+        if Kc is None:
+            Kc = serializeKcValues(Kip['Kc'])
+            if len(Kc)>0x20:
+                print("serializeIni1(): Kc is too large for KIP %d." % (KipIndex))
+                return None
+            Kc+= [0xFFFFFFFF] * (0x20-len(Kc))
+
+        struct.pack_into('<I12sQIBBBB', KipData, 0x0, 0x3150494b, Name, Kip['ProgramId'], Kip['Version'], Kip['MainThreadPriority'], Kip['MainThreadCoreNumber'], Kip['Reserved_x1E'], Kip['Flags'])
+        struct.pack_into('<I', KipData, 0x2C, Kip['MainThreadAffinityMask'])
+        struct.pack_into('<I', KipData, 0x3C, Kip['MainThreadStackSize'])
+        struct.pack_into('<I', KipData, 0x4C, Kip['Reserved_x4C'])
+        struct.pack_into('<9I', KipData, 0x5C, Kip['Reserved_x5C'], Kip['Reserved_x60'], Kip['Reserved_x64'], Kip['Reserved_x68'], Kip['Reserved_x6C'], Kip['Reserved_x70'], Kip['Reserved_x74'], Kip['Reserved_x78'], Kip['Reserved_x7C'])
+        struct.pack_into('<32I', KipData, 0x80, *Kc)
+        out+= KipData
+
+    return out
+
+# Entries is the bdf_read output. The data_offset of each entry is used as-is, unless Relayout is set, where the data is stored contiguously following the entry table.
+def serializeBdf(Entries, Relayout=False):
+    TableEnd = 0x8+len(Entries)*0x10
+    Offsets = []
+    Size = TableEnd
+    pos = TableEnd-0x8
+    for entry in Entries:
+        if Relayout:
+            Offsets.append(pos)
+            pos=pos+len(entry['data'])
+        else:
+            Offsets.append(entry['data_offset'])
+        Size = max(Size, 0x8+Offsets[-1]+len(entry['data']))
+
+    out = bytearray(Size)
+    struct.pack_into('<II', out, 0x0, 0x546c7373, len(Entries))
+    for i, entry in enumerate(Entries):
+        data_size = len(entry['data']) if Relayout else entry['data_size']
+        struct.pack_into('<IIII', out, 0x8+i*0x10, entry['id'], entry['status'], data_size, Offsets[i])
+        out[0x8+Offsets[i]:0x8+Offsets[i]+len(entry['data'])] = entry['data']
+    return out
+
+# Returns the absolute offsets/sizes of the NPDM blocks, for use with the serializePatchMeta* functions.
+def serializeMetaLayout(buf):
+    AciOffset, AciSize, AcidOffset, AcidSize = struct.unpack_from('<IIII', buf, 0x70)
+    FacOffset, FacSize, SacOffset, SacSize, KcOffset, KcSize = struct.unpack_from('<IIIIII', buf, AciOffset+0x20)
+    return {'Aci': AciOffset, 'AciSize': AciSize, 'Acid': AcidOffset, 'AcidSize': AcidSize, 'Fac': AciOffset+FacOffset, 'FacSize': FacSize, 'Sac': AciOffset+SacOffset, 'SacSize': SacSize, 'Kc': AciOffset+KcOffset, 'KcSize': KcSize}
+
+def serializePatchMetaKc(buf, Layout, Index, Value):
+    if Index*0x4 >= Layout['KcSize']:
+        print("serializePatchMetaKc(): Index %d is out-of-bounds." % (Index))
+        return False
+    struct.pack_into('<I', buf, Layout['Kc']+Index*0x4, Value)
+    return True
+
+# KipOffset is from serializeIni1Layout.
+def serializePatchKipKc(buf, KipOffset, Index, Value):
+    if Index >= 0x20:
+        print("serializePatchKipKc(): Index %d is out-of-bounds." % (Index))
+        return False
+    struct.pack_into('<I', buf, KipOffset+0x80+Index*0x4, Value)
+    return True
+
+# Rewrites the SAC entry at Index: the Name length must match the original entry. IsServer=None keeps the original type.
+def serializePatchMetaSac(buf, Layout, Index, Name, IsServer=None):
+    pos = Layout['Sac']
+    end = pos+Layout['SacSize']
+    for i in range(Index):
+        if pos >= end:
+            break
+        pos=pos+(buf[pos]&0x7)+2
+    if pos >= end:
+        print("serializePatchMetaSac(): Index %d is out-of-bounds." % (Index))
+        return False
+
+    Name = Name.encode('utf8')
+    Value = buf[pos]
+    if len(Name)!=(Value&0x7)+1:
+        print("serializePatchMetaSac(): The Name length must match the original entry.")
+        return False
+    if IsServer is not None:
+        Value = (Value & ~0x80) | (0x80 if IsServer else 0x0)
+
+    buf[pos] = Value
+    buf[pos+1:pos+1+len(Name)] = Name
+    return True
+
+def serializePatchMetaFacFsAccessFlag(buf, Layout, Value):
+    struct.pack_into('<Q', buf, Layout['Fac']+0x4, Value)
+    return True
+
+def serializePatchMetaFacContentOwnerId(buf, Layout, Index, Id):
+    ContentOwnerInfoOffset, ContentOwnerInfoSize = struct.unpack_from('<II', buf, Layout['Fac']+0xC)
+    if ContentOwnerInfoSize==0 or Index >= struct.unpack_from('<I', buf, Layout['Fac']+ContentOwnerInfoOffset)[0]:
+        print("serializePatchMetaFacContentOwnerId(): Index %d is out-of-bounds." % (Index))
+        return False
+    struct.pack_into('<Q', buf, Layout['Fac']+ContentOwnerInfoOffset+0x4+Index*0x8, Id)
+    return True
+
+def serializePatchMetaFacSaveDataOwner(buf, Layout, Index, Id=None, Access=None):
+    SaveDataOwnerInfoOffset, SaveDataOwnerInfoSize = struct.unpack_from('<II', buf, Layout['Fac']+0x14)
+    if SaveDataOwnerInfoSize==0:
+        print("serializePatchMetaFacSaveDataOwner(): Index %d is out-of-bounds." % (Index))
+        return False
+    Count, = struct.unpack_from('<I', buf, Layout['Fac']+SaveDataOwnerInfoOffset)
+    if Index >= Count:
+        print("serializePatchMetaFacSaveDataOwner(): Index %d is out-of-bounds." % (Index))
+        return False
+
+    if Access is not None:
+        buf[Layout['Fac']+SaveDataOwnerInfoOffset+0x4+Index] = Access
+    if Id is not None:
+        OffsetId = serializeAlign(SaveDataOwnerInfoOffset+0x4+Count, 0x4)
+        struct.pack_into('<Q', buf, Layout['Fac']+OffsetId+Index*0x8, Id)
+    return True
+
+# Rewrites the BDF entry at Index. Data must have the same size as the original entry data.
+def serializePatchBdfEntry(buf, Index, EntryId=None, Status=None, Data=None):
+    entrycount, = struct.unpack_from('<I', buf, 0x4)
+    if Index >= entrycount:
+        print("serializePatchBdfEntry(): Index %d is out-of-bounds." % (Index))
+        return False
+
+    pos = 0x8+Index*0x10
+    entry_id, status, data_size, data_offset = struct.unpack_from('<IIII', buf, pos)
+    if Data is not None and len(Data)!=data_size:
+        print("serializePatchBdfEntry(): The Data size must match the original entry (0x%X)." % (data_size))
+        return False
+
+    struct.pack_into('<II', buf, pos, entry_id if EntryId is None else EntryId, status if Status is None else Status)
+    if Data is not None:
+        buf[0x8+data_offset:0x8+data_offset+data_size] = Data
+    return True
+
+def serializeRandomKc(rand, MaxCount):
+    # The bitcount for each supported descriptor type, excluding MemoryMap which uses 2 descriptors.
+    BitCounts = [3, 4, 7, 10, 11, 13, 14, 15, 16]
+
+    Values = []
+    while len(Values) < MaxCount:
+        if len(Values) < MaxCount-1 and rand.randrange(8)==0: # MemoryMap
+            for i in range(2):
+                Values.append(((rand.getrandbits(25) << 7) | 0x3F) & 0xFFFFFFFF)
+            continue
+        BitCount = rand.choice(BitCounts)
+        Values.append(((rand.getrandbits(31-BitCount) << (BitCount+1)) | ((1<<BitCount)-1)) & 0xFFFFFFFF)
+    return struct.pack('<%dI' % (len(Values)), *Values)
+
+def serializeRandomName(rand, MaxLen, MinLen=0):
+    return ''.join([rand.choice('abcdefghijklmnopqrstuvwxyz:-') for i in range(rand.randint(MinLen, MaxLen))])
+
+def serializeRandomMeta(rand):
+    from nx_meta import metaDecodeKc
+
+    Sac = {'Server': {}, 'Client': {}}
+    for SacKey in ['Server', 'Client']:
+        for i in range(rand.randint(0, 6)):
+            Name = serializeRandomName(rand, 8, 1)
+            Sac[SacKey][Name] = (0x80 if SacKey=='Server' else 0x0) | (len(Name)-1)
+
+    Fac = {'Version': rand.getrandbits(8), 'Padding': bytes(rand.getrandbits(8) for i in range(3)), 'FsAccessFlag': rand.getrandbits(64)}
+    Fac['ContentOwnerInfo'] = [{'Id': rand.getrandbits(64)} for i in range(rand.randint(0, 4))]
+    Fac['SaveDataOwnerInfo'] = [{'Id': rand.getrandbits(64), 'Access': rand.getrandbits(8)} for i in range(rand.randint(0, 4))]
+
+    Aci = {'Reserved_x4': rand.getrandbits(32), 'Reserved_x8': rand.getrandbits(32), 'Reserved_xC': rand.getrandbits(32), 'ProgramId': rand.getrandbits(64), 'Reserved_x18': rand.getrandbits(32), 'Reserved_x1C': rand.getrandbits(32), 'Reserved_x38': rand.getrandbits(32), 'Reserved_x3C': rand.getrandbits(32)}
+    Aci['Fac'] = Fac
+    Aci['Sac'] = Sac
+    Aci['Kc'] = metaDecodeKc(serializeRandomKc(rand, rand.randint(1, 0x40)), 'serializeRandomMeta')
+
+    Meta = {'SignatureKeyGeneration': rand.getrandbits(32), 'Reserved_x8': rand.getrandbits(32), 'Flags': rand.getrandbits(8), 'Reserved_xD': rand.getrandbits(8), 'MainThreadPriority': rand.getrandbits(8), 'MainThreadCoreNumber': rand.getrandbits(8), 'Reserved_x10': rand.getrandbits(32), 'SystemResourceSize': rand.getrandbits(32), 'Version': rand.getrandbits(32), 'MainThreadStackSize': rand.getrandbits(32)}
+    Meta['Name'] = serializeRandomName(rand, 0x10)
+    Meta['ProductCode'] = bytes(rand.getrandbits(8) for i in range(0x10))
+    Meta['Reserved_x40'] = bytes(rand.getrandbits(8) for i in range(0x30))
+    Meta['Acid'] = {'Version': rand.getrandbits(8), 'Unk_x209': rand.getrandbits(8), 'Reserved_x20A': rand.getrandbits(8), 'Reserved_x20B': rand.getrandbits(8), 'Flags': rand.getrandbits(32), 'ProgramIdMin': rand.getrandbits(64), 'ProgramIdMax': rand.getrandbits(64)}
+    Meta['Aci'] = Aci
+    return Meta
+
+def serializeRandomIni1(rand):
+    from nx_meta import metaDecodeKc
+
+    Kips = []
+    for KipIndex in range(rand.randint(1, 6)):
+        Kip = {'Name': serializeRandomName(rand, 0xC), 'ProgramId': rand.getrandbits(64), 'Version': rand.getrandbits(32), 'MainThreadPriority': rand.getrandbits(8), 'MainThreadCoreNumber': rand.getrandbits(8), 'Reserved_x1E': rand.getrandbits(8), 'Flags': rand.getrandbits(8), 'MainThreadAffinityMask': rand.getrandbits(32), 'MainThreadStackSize': rand.getrandbits(32), 'Reserved_x4C': rand.getrandbits(32)}
+        for Offset in range(0x5C, 0x80, 0x4):
+            Kip['Reserved_x%X' % (Offset)] = rand.getrandbits(32)
+        Kip['Kc'] = metaDecodeKc(serializeRandomKc(rand, rand.randint(1, 0x20)), 'serializeRandomIni1')
+        Kips.append(Kip)
+    return {'Size': 0x10+len(Kips)*0x100, 'Reserved_xC': rand.getrandbits(32), 'Kips': Kips}
+
+# Returns the KC descriptors shuffled (MemoryMap pairs are kept together) with 0xFFFFFFFF padding inserted between them, padded to Count descriptors when specified.
+def serializeRandomKcReorder(rand, Kc, Count=None):
+    Values = [desc[0] for desc in struct.iter_unpack('<I', Kc)]
+    Groups = []
+    pos=0
+    while pos<len(Values):
+        Size = 2 if Values[pos]&0x7F==0x3F else 1
+        Groups.append(Values[pos:pos+Size])
+        pos=pos+Size
+    rand.shuffle(Groups)
+
+    MaxPadding = rand.randint(0, 4) if Count is None else Count-len(Values)
+    for i in range(MaxPadding):
+        Groups.insert(rand.randint(0, len(Groups)), [0xFFFFFFFF])
+    Values = [desc for Group in Groups for desc in Group]
+    return struct.pack('<%dI' % (len(Values)), *Values)
+
+# Relayouts NPDM data with the non-canonical variants which occur in real files: reordered/padded KC descriptors, interleaved SAC Server/Client entries, shuffled block order with gaps, and optionally the ACID before the ACI0.
+def serializeRandomMetaRelayout(rand, data):
+    Layout = serializeMetaLayout(data)
+    Blocks = {Key: bytes(data[Layout[Key]:Layout[Key]+Layout[Key+'Size']]) for Key in ['Fac', 'Sac', 'Kc']}
+
+    Sac = Blocks['Sac']
+    Entries = []
+    pos=0
+    while pos<len(Sac):
+        Size = (Sac[pos]&0x7)+2
+        Entries.append(Sac[pos:pos+Size])
+        pos=pos+Size
+    rand.shuffle(Entries)
+    Blocks['Sac'] = b''.join(Entries)
+    Blocks['Kc'] = serializeRandomKcReorder(rand, Blocks['Kc'])
+
+    Keys = list(Blocks)
+    rand.shuffle(Keys)
+    Offsets = {}
+    pos=0x40
+    for Key in Keys:
+        Offsets[Key] = serializeAlign(pos, rand.choice([0x4, 0x10])) + rand.choice([0x0, 0x0, 0x10])
+        pos = Offsets[Key]+len(Blocks[Key])
+    pos = max([pos] + [Offset+1 for Offset in Offsets.values()])
+    AciData = bytearray(rand.getrandbits(8) for i in range(pos+rand.randrange(0x10)))
+    AciData[0x0:0x40] = data[Layout['Aci']:Layout['Aci']+0x40]
+    struct.pack_into('<IIIIII', AciData, 0x20, Offsets['Fac'], len(Blocks['Fac']), Offsets['Sac'], len(Blocks['Sac']), Offsets['Kc'], len(Blocks['Kc']))
+    for Key, Block in Blocks.items():
+        AciData[Offsets[Key]:Offsets[Key]+len(Block)] = Block
+
+    AcidData = data[Layout['Acid']:Layout['Acid']+Layout['AcidSize']]
+    First, Second = (AcidData, AciData) if rand.randrange(2)==0 else (AciData, AcidData)
+    FirstOffset = 0x80 + rand.choice([0x0, 0x0, 0x10])
+    SecondOffset = serializeAlign(FirstOffset+len(First), 0x10) + rand.choice([0x0, 0x0, 0x10])
+    out = bytearray(rand.getrandbits(8) for i in range(SecondOffset+len(Second)+rand.randrange(0x10)))
+    out[0x0:0x70] = data[0x0:0x70]
+    out[FirstOffset:FirstOffset+len(First)] = First
+    out[SecondOffset:SecondOffset+len(Second)] = Second
+    if First is AciData:
+        struct.pack_into('<IIII', out, 0x70, FirstOffset, len(AciData), SecondOffset, len(AcidData))
+    else:
+        struct.pack_into('<IIII', out, 0x70, SecondOffset, len(AciData), FirstOffset, len(AcidData))
+    return out
+
+# Reorders/pads the KC descriptors of each KIP in INI1 data.
+def serializeRandomIni1Relayout(rand, data):
+    out = bytearray(data)
+    for Offset, Size in serializeIni1Layout(out):
+        Values = [desc for desc in struct.unpack_from('<32I', out, Offset+0x80) if desc!=0xFFFFFFFF]
+        out[Offset+0x80:Offset+0x100] = serializeRandomKcReorder(rand, struct.pack('<%dI' % (len(Values)), *Values), 0x20)
+    return out
+
+def serializeRandomBdf(rand):
+    return [{'id': i, 'status': rand.getrandbits(1), 'data': bytes(rand.getrandbits(8) for j in range(rand.randint(0, 0x40)))} for i in range(rand.randint(0, 8))]
+
+def serializeSelfTestMetaRelayout(rand, data, i):
+    import copy
+
+    Relayout = serializeRandomMetaRelayout(rand, data)
+    tmp = metaLoadData('selftest', Relayout)
+    if tmp is None or serializeMeta(tmp['Meta'], Relayout)!=Relayout or metaLoadData('selftest', serializeMeta(tmp['Meta']))!=tmp:
+        print("serializeSelfTest(): Meta relayout round-trip failed for iteration %d." % (i))
+        return False
+
+    # Changing the FAC with Base must keep the raw SAC/KC from Base, also when the FAC size changes.
+    Expected = copy.deepcopy(tmp['Meta'])
+    Expected['Aci']['Fac']['FsAccessFlag'] = rand.getrandbits(64)
+    if rand.randrange(2)==0:
+        Expected['Aci']['Fac']['ContentOwnerInfo'].append({'Id': rand.getrandbits(64)})
+    out = serializeMeta(Expected, Relayout)
+    BaseLayout = serializeMetaLayout(Relayout)
+    Layout = serializeMetaLayout(out)
+    for Key in ['Sac', 'Kc']:
+        if out[Layout[Key]:Layout[Key]+Layout[Key+'Size']]!=Relayout[BaseLayout[Key]:BaseLayout[Key]+BaseLayout[Key+'Size']]:
+            print("serializeSelfTest(): Meta relayout %s wasn't preserved for iteration %d." % (Key, i))
+            return False
+    if metaLoadData('selftest', out)!={'Meta': Expected}:
+        print("serializeSelfTest(): Meta relayout update failed for iteration %d." % (i))
+        return False
+    return True
+
+# Round-trip test over generated inputs: parse(serialize(x)) must equal x and serialize(parse(data)) must equal data, and the patched output must match the serialized modified input.
+# The serializer output is canonical, hence the inputs are also relayouted (see serializeRandomMetaRelayout) to check that serialize(parse(data), data) is byte-exact for non-canonical data. Returns the number of failures.
+def serializeSelfTest(Count=1000, Seed=0):
+    import copy
+    import random
+    from nx_meta import metaDecodeKc
+    from ssl_bdf import bdf_read_data
+
+    rand = random.Random(Seed)
+    Failures = 0
+
+    for i in range(Count):
+        Meta = serializeRandomMeta(rand)
+        data = serializeMeta(Meta)
+        tmp = metaLoadData('selftest', data)
+        if tmp!={'Meta': Meta} or serializeMeta(tmp['Meta'], data)!=data:
+            print("serializeSelfTest(): Meta round-trip failed for iteration %d." % (i))
+            Failures+= 1
+            continue
+
+        Patched = bytearray(data)
+        Layout = serializeMetaLayout(Patched)
+        Expected = copy.deepcopy(Meta)
+        Expected['Aci']['Fac']['FsAccessFlag'] = rand.getrandbits(64)
+        serializePatchMetaFacFsAccessFlag(Patched, Layout, Expected['Aci']['Fac']['FsAccessFlag'])
+        for Index, Info in enumerate(Expected['Aci']['Fac']['ContentOwnerInfo']):
+            Info['Id'] = rand.getrandbits(64)
+            serializePatchMetaFacContentOwnerId(Patched, Layout, Index, Info['Id'])
+        for Index, Info in enumerate(Expected['Aci']['Fac']['SaveDataOwnerInfo']):
+            Info['Id'] = rand.getrandbits(64)
+            Info['Access'] = rand.getrandbits(8)
+            serializePatchMetaFacSaveDataOwner(Patched, Layout, Index, Info['Id'], Info['Access'])
+        if serializeMeta(Expected)!=Patched:
+            print("serializeSelfTest(): Meta patch failed for iteration %d." % (i))
+            Failures+= 1
+
+        # Renaming a SAC entry changes the dict order, hence the parsed output is compared instead.
+        Sac = Expected['Aci']['Sac']
+        Names = [('Server', Name) for Name in Sac['Server']] + [('Client', Name) for Name in Sac['Client']]
+        if len(Names)>0:
+            Index = rand.randrange(len(Names))
+            SacKey, Name = Names[Index]
+            NewName = serializeRandomName(rand, len(Name), len(Name))
+            if NewName not in Sac[SacKey]:
+                Sac[SacKey][NewName] = Sac[SacKey].pop(Name)
+                serializePatchMetaSac(Patched, Layout, Index, NewName)
+
+        Index = rand.randrange(Layout['KcSize']//0x4)
+        Value = struct.unpack_from('<I', Patched, Layout['Kc']+Index*0x4)[0] ^ (rand.getrandbits(8) << 24)
+        serializePatchMetaKc(Patched, Layout, Index, Value)
+        Kc = metaDecodeKc(Patched[Layout['Kc']:Layout['Kc']+Layout['KcSize']], 'selftest')
+        if metaLoadData('selftest', Patched)!={'Meta': dict(Expected, Aci=dict(Expected['Aci'], Kc=Kc))} or struct.unpack_from('<I', Patched, Layout['Kc']+Index*0x4)[0]!=Value:
+            print("serializeSelfTest(): Meta SAC/KC patch failed for iteration %d." % (i))
+            Failures+= 1
+
+        if serializeSelfTestMetaRelayout(rand, data, i) is False:
+            Failures+= 1
+
+        Ini1 = serializeRandomIni1(rand)
+        data = serializeIni1(Ini1)
+        tmp = metaIni1Load('selftest', data)
+        if tmp!={'Ini1': Ini1} or serializeIni1(tmp['Ini1'], data)!=data:
+            print("serializeSelfTest(): Ini1 round-trip failed for iteration %d." % (i))
+            Failures+= 1
+            continue
+
+        Relayout = serializeRandomIni1Relayout(rand, data)
+        tmp = metaIni1Load('selftest', Relayout)
+        if tmp is None or serializeIni1(tmp['Ini1'], Relayout)!=Relayout or metaIni1Load('selftest', serializeIni1(tmp['Ini1']))!=tmp:
+            print("serializeSelfTest(): Ini1 relayout round-trip failed for iteration %d." % (i))
+            Failures+= 1
+
+        Patched = bytearray(data)
+        KipIndex = rand.randrange(len(Ini1['Kips']))
+        Expected = serializeKcValues(Ini1['Kips'][KipIndex]['Kc'])
+        Index = rand.randrange(len(Expected))
+        Expected[Index]^= rand.getrandbits(8) << 24
+        serializePatchKipKc(Patched, serializeIni1Layout(Patched)[KipIndex][0], Index, Expected[Index])
+        if metaIni1Load('selftest', Patched)['Ini1']['Kips'][KipIndex]['Kc']!=metaDecodeKc(struct.pack('<%dI' % (len(Expected)), *Expected), 'selftest'):
+            print("serializeSelfTest(): Ini1 KC patch failed for iteration %d." % (i))
+            Failures+= 1
+
+        Entries = serializeRandomBdf(rand)
+        data = serializeBdf(Entries, Relayout=True)
+        tmp = bdf_read_data('selftest', data)
+        if [{'id': entry['id'], 'status': entry['status'], 'data': entry['data']} for entry in tmp]!=Entries or serializeBdf(tmp)!=data:
+            print("serializeSelfTest(): Bdf round-trip failed for iteration %d." % (i))
+            Failures+= 1
+            continue
+
+        Patched = bytearray(data)
+        for Index, entry in enumerate(Entries):
+            entry['status'] = rand.getrandbits(32)
+            entry['data'] = bytes(rand.getrandbits(8) for j in range(len(entry['data'])))
+            serializePatchBdfEntry(Patched, Index, Status=entry['status'], Data=entry['data'])
+        if serializeBdf(Entries, Relayout=True)!=Patched:
+            print("serializeSelfTest(): Bdf patch failed for iteration %d." % (i))
+            Failures+= 1
+
+    print("serializeSelfTest(): %d iterations, %d failures." % (Count, Failures))
+    return Failures
+
+if __name__ == "__main__":
+    if len(sys.argv)>1 and sys.argv[1]=='selftest':
+        Count = 1000
+        if len(sys.argv)>2:
+            Count = int(sys.argv[2])
+        sys.exit(1 if serializeSelfTest(Count) else 0)
+    else:
+        print("Usage:\n%s selftest [iterations]" % (sys.argv[0]))
@@ -0,0 +1,179 @@
+#!/usr/bin/python3
+import os
+import sys
+import json
+import hashlib
+from nx_meta import metaLoad, metaDiffLoaded, metaJsonDefault
+from nx_intern import InternScope
+
+# Sharded scan: the work list is split deterministically into N shards by the hash of each item Id, each shard writes a self-contained partial result file, and shardMerge() combines the partials.
+# The work list is a JSON object: {"Meta": {Id: {"Prev": path, "Cur": path}}, "Bdf": {Id: {"Prev": path, "Cur": path}}}, where "Meta" is the metaDiffPathArray input.
+# All output is canonical JSON (sorted keys, bytes as hex) with a sha256 checksum, hence merging is order-independent, and the merged output for N shards is identical to the output with 1 shard.
+
+SHARD_FORMAT_VERSION = 1
+SHARD_WORK_TYPES = ['Meta', 'Bdf']
+
+def shardCanonicalJson(obj):
+    return json.dumps(obj, sort_keys=True, separators=(',', ':'), default=metaJsonDefault)
+
+def shardChecksum(obj):
+    return hashlib.sha256(shardCanonicalJson(obj).encode('utf8')).hexdigest()
+
+def shardGetIndex(Id, ShardCount):
+    return int.from_bytes(hashlib.sha256(Id.encode('utf8')).digest()[:8], 'little') % ShardCount
+
+def shardWorkListLoad(path):
+    with open(path, 'r') as tmpf:
+        WorkList = json.load(tmpf)
+    for Type in SHARD_WORK_TYPES:
+        if Type not in WorkList:
+            WorkList[Type] = {}
+    return WorkList
+
+def shardBdfDiff(Id, PrevPath, CurPath):
+    from ssl_bdf import bdf_read, bdf_diff
+
+    # Only the raw entry data is compared, hence the certificates aren't decoded.
+    Prev = bdf_read(PrevPath, load_x509=False)
+    Cur = bdf_read(CurPath, load_x509=False)
+    if Prev is None or Cur is None:
+        print("shardBdfDiff(): Skipping diff for %s since loading Prev/Cur failed." % (Id))
+        return None, None, None
+    return Prev, Cur, bdf_diff(Prev, Cur)
+
+# Scans the items of the work list which belong to the specified shard. With IncludeParsed the parsed Prev/Cur are included in the output, besides the diff.
+def shardScan(WorkList, ShardIndex, ShardCount, IncludeParsed=False):
+    Results = {Type: {} for Type in SHARD_WORK_TYPES}
+    Parsed = {Type: {} for Type in SHARD_WORK_TYPES}
+
+    # The parsed output is only read (and round-tripped through JSON below), hence the loads are interned.
+    with InternScope():
+        for Type in SHARD_WORK_TYPES:
+            for Id, Paths in sorted(WorkList[Type].items()):
+                if shardGetIndex(Id, ShardCount)!=ShardIndex:
+                    continue
+
+                if Type=='Meta':
+                    Prev = metaLoad(Paths['Prev'])
+                    Cur = metaLoad(Paths['Cur'])
+                    tmp = metaDiffLoaded(Id, Prev, Cur)
+                else:
+                    Prev, Cur, tmp = shardBdfDiff(Id, Paths['Prev'], Paths['Cur'])
+
+                if tmp is None:
+                    continue
+                Results[Type][Id] = tmp
+                if IncludeParsed:
+                    Parsed[Type][Id] = {'Prev': Prev, 'Cur': Cur}
+
+    # Round-trip through the canonical JSON, so that the in-memory output matches what is written.
+    out = {'FormatVersion': SHARD_FORMAT_VERSION, 'WorkListDigest': shardChecksum(WorkList), 'ShardIndex': ShardIndex, 'ShardCount': ShardCount, 'Results': json.loads(shardCanonicalJson(Results))}
+    if IncludeParsed:
+        out['Parsed'] = json.loads(shardCanonicalJson(Parsed))
+    out['Checksum'] = shardChecksum(out)
+    return out
+
+def shardWrite(path, out):
+    tmppath = path + '.tmp'
+    with open(tmppath, 'w') as tmpf:
+        tmpf.write(shardCanonicalJson(out))
+    os.replace(tmppath, path)
+
+def shardRead(path):
+    with open(path, 'r') as tmpf:
+        out = json.load(tmpf)
+
+    Checksum = out.pop('Checksum', None)
+    if Checksum is None or Checksum!=shardChecksum(out):
+        print("shardRead('%s'): Checksum mismatch." % (path))
+        return None
+    out['Checksum'] = Checksum
+    return out
+
+# Partials is a list of shardScan output. Returns None when the partials are inconsistent or incomplete.
+def shardMerge(Partials):
+    if len(Partials)==0:
+        print("shardMerge(): No partials were specified.")
+        return None
+
+    First = Partials[0]
+    ShardCount = First['ShardCount']
+    IncludeParsed = 'Parsed' in First
+    Shards = set()
+
+    Results = {Type: {} for Type in SHARD_WORK_TYPES}
+    Parsed = {Type: {} for Type in SHARD_WORK_TYPES}
+
+    for Partial in Partials:
+        tmp = dict(Partial)
+        Checksum = tmp.pop('Checksum', None)
+        if Checksum is None or Checksum!=shardChecksum(tmp):
+            print("shardMerge(): Checksum mismatch for shard %d." % (Partial['ShardIndex']))
+            return None
+        if Partial['FormatVersion']!=SHARD_FORMAT_VERSION or Partial['WorkListDigest']!=First['WorkListDigest'] or Partial['ShardCount']!=ShardCount or ('Parsed' in Partial)!=IncludeParsed:
+            print("shardMerge(): Shard %d is from a different scan." % (Partial['ShardIndex']))
+            return None
+        if Partial['ShardIndex'] in Shards:
+            print("shardMerge(): Shard %d was specified multiple times." % (Partial['ShardIndex']))
+            return None
+        Shards.add(Partial['ShardIndex'])
+
+        for Type in SHARD_WORK_TYPES:
+            for Id, Value in Partial['Results'][Type].items():
+                if shardGetIndex(Id, ShardCount)!=Partial['ShardIndex']:
+                    print("shardMerge(): %s doesn't belong to shard %d." % (Id, Partial['ShardIndex']))
+                    return None
+                Results[Type][Id] = Value
+            if IncludeParsed:
+                Parsed[Type].update(Partial['Parsed'][Type])
+
+    if Shards!=set(range(ShardCount)):
+        print("shardMerge(): Missing shards: %s" % (sorted(set(range(ShardCount)) - Shards)))
+        return None
+
+    out = {'FormatVersion': SHARD_FORMAT_VERSION, 'WorkListDigest': First['WorkListDigest'], 'Results': Results}
+    if IncludeParsed:
+        out['Parsed'] = Parsed
+    out['Checksum'] = shardChecksum(out)
+    return out
+
+def shardScanWorker(args):
+    WorkListPath, ShardIndex, ShardCount, IncludeParsed, OutPath = args
+    shardWrite(OutPath, shardScan(shardWorkListLoad(WorkListPath), ShardIndex, ShardCount, IncludeParsed))
+    return OutPath
+
+# Runs every shard in a local process pool, then merges the partials.
+def shardRunLocal(WorkListPath, ShardCount, OutDir, IncludeParsed=False, Processes=None):
+    from multiprocessing import Pool
+
+    os.makedirs(OutDir, exist_ok=True)
+    Jobs = [(WorkListPath, ShardIndex, ShardCount, IncludeParsed, os.path.join(OutDir, "shard_%d_of_%d.json" % (ShardIndex, ShardCount))) for ShardIndex in range(ShardCount)]
+    with Pool(Processes) as pool:
+        OutPaths = pool.map(shardScanWorker, Jobs)
+
+    Partials = [shardRead(path) for path in OutPaths]
+    if None in Partials:
+        return None
+    return shardMerge(Partials)
+
+if __name__ == "__main__":
+    args = [arg for arg in sys.argv[1:] if arg!='--parsed']
+    IncludeParsed = len(args)!=len(sys.argv)-1
+
+    if len(args)==5 and args[0]=='scan':
+        shardWrite(args[4], shardScan(shardWorkListLoad(args[1]), int(args[2]), int(args[3]), IncludeParsed))
+    elif len(args)>2 and args[0]=='merge':
+        Partials = [shardRead(path) for path in args[2:]]
+        out = None
+        if None not in Partials:
+            out = shardMerge(Partials)
+        if out is None:
+            sys.exit(1)
+        shardWrite(args[1], out)
+    elif len(args)==5 and args[0]=='local':
+        out = shardRunLocal(args[1], int(args[2]), args[3], IncludeParsed)
+        if out is None:
+            sys.exit(1)
+        shardWrite(args[4], out)
+    else:
+        print("Usage:\n%s scan <work list> <shard index> <shard count> <partial output path> [--parsed]\n%s merge <output path> <partial path>...\n%s local <work list> <shard count> <partial output dir> <output path> [--parsed]" % (sys.argv[0], sys.argv[0], sys.argv[0]))
@@ -0,0 +1,131 @@
+#!/usr/bin/python3
+import os
+import sys
+
+# Single entry point for the tools. The subsystems are only imported by the subcommand which needs them, so that startup stays fast: notably cryptography is only imported when certificates are decoded.
+
+TOOLS_USAGE = """Usage:
+%s meta load <path>
+%s meta diff <prev path> <cur path>
+%s ini1 load <INI1/package2 path>
+%s ini1 diff <prev path> <cur path>
+%s bdf read <ssl .bdf path>
+%s bdf diff <prev path> <cur path>
+%s probe <path>...
+%s bench-startup [max overhead in ms]"""
+
+# Modules which must not be imported by just importing the tools.
+TOOLS_LAZY_MODULES = ['cryptography', 'concurrent.futures', 'socketserver', 'ctypes']
+
+def toolsMetaLoad(args):
+    from nx_meta import metaLoad
+
+    out = metaLoad(args[0])
+    print(out)
+    return 0 if out is not None else 1
+
+def toolsMetaDiff(args):
+    from nx_meta import metaDiffPathArray
+
+    out = metaDiffPathArray({args[1]: {'Prev': args[0], 'Cur': args[1]}})
+    if args[1] not in out:
+        return 1
+    print(out[args[1]])
+    return 0
+
+def toolsBdfRead(args):
+    from ssl_bdf import bdf_read, bdf_print
+
+    out = bdf_read(args[0])
+    if out is None:
+        return 1
+    bdf_print(out)
+    return 0
+
+def toolsBdfDiff(args):
+    from ssl_bdf import bdf_read, bdf_diff
+
+    # The diff only compares the raw entry data, so the certificates aren't decoded.
+    out = bdf_diff(bdf_read(args[0], load_x509=False), bdf_read(args[1], load_x509=False))
+    if out is None:
+        return 1
+    print(out)
+    return 0
+
+def toolsProbe(args):
+    from nx_meta import metaProbePathArray, metaProbePrint
+
+    metaProbePrint(metaProbePathArray(args))
+    return 0
+
+def toolsBenchRun(Code, Runs):
+    import subprocess
+    import time
+
+    Best = None
+    for i in range(Runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, '-c', Code], cwd=os.path.dirname(os.path.abspath(__file__)), check=True)
+        tmp = time.perf_counter() - start
+        if Best is None or tmp < Best:
+            Best = tmp
+    return Best
+
+# Measures the cold-start import overhead of the tools versus a bare interpreter, and fails when it exceeds MaxMs or when a heavy module is imported eagerly.
+def toolsBenchStartup(MaxMs=40.0, Runs=20):
+    import subprocess
+
+    Imports = "import nx_tools, nx_meta, nx_container, ssl_bdf"
+    Code = "import sys; %s; print(','.join([Name for Name in %r if Name in sys.modules]))" % (Imports, TOOLS_LAZY_MODULES)
+    Loaded = subprocess.run([sys.executable, '-c', Code], cwd=os.path.dirname(os.path.abspath(__file__)), check=True, stdout=subprocess.PIPE).stdout.decode('utf8').strip()
+
+    Base = toolsBenchRun("pass", Runs)
+    Tools = toolsBenchRun(Imports, Runs)
+    Overhead = (Tools - Base) * 1000
+
+    print("bench-startup: interpreter %.1fms, with tools imported %.1fms, overhead %.1fms (max %.1fms)." % (Base*1000, Tools*1000, Overhead, MaxMs))
+
+    ret = 0
+    if len(Loaded)>0:
+        print("bench-startup: FAIL: Modules imported eagerly: %s" % (Loaded))
+        ret = 1
+    if Overhead > MaxMs:
+        print("bench-startup: FAIL: Import overhead regressed.")
+        ret = 1
+    return ret
+
+def toolsBenchStartupCmd(args):
+    if len(args)>0:
+        return toolsBenchStartup(float(args[0]))
+    return toolsBenchStartup()
+
+# (subcommand, action): (handler, minimum arg count, maximum arg count or None)
+TOOLS_COMMANDS = {
+    ('meta', 'load'): (toolsMetaLoad, 1, 1),
+    ('meta', 'diff'): (toolsMetaDiff, 2, 2),
+    ('ini1', 'load'): (toolsMetaLoad, 1, 1),
+    ('ini1', 'diff'): (toolsMetaDiff, 2, 2),
+    ('bdf', 'read'): (toolsBdfRead, 1, 1),
+    ('bdf', 'diff'): (toolsBdfDiff, 2, 2),
+    ('probe', None): (toolsProbe, 1, None),
+    ('bench-startup', None): (toolsBenchStartupCmd, 0, 1),
+}
+
+def toolsMain(argv):
+    Command = None
+    args = []
+    if len(argv)>2 and (argv[1], argv[2]) in TOOLS_COMMANDS:
+        Command = TOOLS_COMMANDS[(argv[1], argv[2])]
+        args = argv[3:]
+    elif len(argv)>1 and (argv[1], None) in TOOLS_COMMANDS:
+        Command = TOOLS_COMMANDS[(argv[1], None)]
+        args = argv[2:]
+
+    if Command is None or len(args) < Command[1] or (Command[2] is not None and len(args) > Command[2]):
+        print(TOOLS_USAGE.replace('%s', argv[0]))
+        return 1
+
+    return Command[0](args)
+
+if __name__ == "__main__":
+    sys.exit(toolsMain(sys.argv))
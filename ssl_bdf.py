@@ -1,36 +1,215 @@
 #!/usr/bin/python3
 import os
 import sys
+import mmap
 import struct
 import binascii
+import bisect
 from os.path import exists
-from cryptography import x509
-from cryptography.hazmat.primitives import hashes
+from nx_intern import internGet
 
-def bdf_read(path):
+# cryptography and the other heavier modules are only imported when needed, since importing cryptography is slow.
+
+def bdf_read(path, load_x509=True):
+    if os.path.exists(path) is False:
+        print("bdf_read(): File doesn't exist: %s" % (path))
+        return None
+
+    with open(path, 'rb') as tmpf:
+        data = tmpf.read()
+
+    return bdf_read_data(path, data, load_x509)
+
+# data can be bytes or a memoryview, such as a view into a container mmap. path is used for messages and for detecting TrustedCerts.
+# Within an InternScope (see nx_intern) the output is interned, hence it's shared between identical files and must not be modified. The entry data/certificates are immutable, hence these are always shared between identical entries.
+def bdf_read_data(path, data, load_x509=True):
+    load_x509 = load_x509 and path.find("TrustedCerts")!=-1
+    return internGet(('Bdf', load_x509), data, lambda: bdf_decode_data(path, data, load_x509))
+
+def bdf_decode_entry(entrydata, load_x509):
+    entrydata = bytes(entrydata)
+    if load_x509:
+        from cryptography import x509
+
+        return (entrydata, x509.load_der_x509_certificate(entrydata))
+    return (entrydata, None)
+
+def bdf_decode_data(path, data, load_x509):
     out = []
-    if os.path.exists(path):
+    magicnum, entrycount = struct.unpack('<II', data[0x0:0x8])
+    if magicnum!=0x546c7373:
+        print("Bad magicnum (0x%x) for bdf_read('%s')." % (magicnum, path))
+        out = None
+    else:
+        for i in range(entrycount):
+            pos = 0x8+i*0x10
+            entry_id, status, data_size, data_offset = struct.unpack('<IIII', data[pos:pos+0x10])
+            entry = {'id': entry_id, 'status': status, 'data_size': data_size, 'data_offset': data_offset}
+            entrydata = data[0x8+data_offset:0x8+data_offset+data_size]
+            entrydata, entry_x509 = internGet(('BdfEntry', load_x509), entrydata, lambda: bdf_decode_entry(entrydata, load_x509), Immutable=True)
+            entry['data'] = entrydata
+            if load_x509:
+                entry['data_x509'] = entry_x509
+            out.append(entry)
+    return out
+
+# Yields the entries one at a time, with 'data' as a memoryview instead of a copy. src is either a path (which is mmap'd) or a bytes-like object.
+# The mapping is closed once the generator finishes or is closed, hence the yielded 'data' views must be released before then: copy with bytes() when the data needs to be kept.
+# Views which are still referenced at that point keep the mapping alive until these are released.
+# Unlike bdf_read, invalid input raises (OSError for a missing file, ValueError for bad data) instead of yielding nothing, so that bdf_diff_iter can't report it as all entries added/removed.
+def bdf_iter(src):
+    if isinstance(src, str):
+        path = src
         with open(path, 'rb') as tmpf:
-            data = tmpf.read()
-            magicnum, entrycount = struct.unpack('<II', data[0x0:0x8])
-            if magicnum!=0x546c7373:
-                print("Bad magicnum (0x%x) for bdf_read('%s')." % (magicnum, path))
-                out = None
-            else:
-                for i in range(entrycount):
-                    pos = 0x8+i*0x10
-                    entry_id, status, data_size, data_offset = struct.unpack('<IIII', data[pos:pos+0x10])
-                    entry = {'id': entry_id, 'status': status, 'data_size': data_size, 'data_offset': data_offset}
-                    entrydata = data[0x8+data_offset:0x8+data_offset+data_size]
-                    entry['data'] = entrydata
-                    if path.find("TrustedCerts")!=-1:
-                        entry['data_x509'] = x509.load_der_x509_certificate(entrydata)
-                    out.append(entry)
+            if os.fstat(tmpf.fileno()).st_size < 0x8:
+                raise ValueError("Input file data is too small for bdf_iter('%s')." % (path))
+            mm = mmap.mmap(tmpf.fileno(), 0, access=mmap.ACCESS_READ)
+
+        try:
+            with memoryview(mm) as data:
+                yield from bdf_iter_data(data, path)
+        finally:
+            try:
+                mm.close()
+            except BufferError:
+                pass
     else:
-        print("bdf_read(): File doesn't exist: %s" % (path))
-        out = None
+        yield from bdf_iter_data(memoryview(src), "<buffer>")
+
+def bdf_iter_data(data, path):
+    if len(data) < 0x8:
+        raise ValueError("Input file data is too small for bdf_iter('%s')." % (path))
+    magicnum, entrycount = struct.unpack('<II', data[0x0:0x8])
+    if magicnum!=0x546c7373:
+        raise ValueError("Bad magicnum (0x%x) for bdf_iter('%s')." % (magicnum, path))
+    if 0x8+entrycount*0x10 > len(data):
+        raise ValueError("Input file data is too small for the entry table for bdf_iter('%s')." % (path))
+
+    for i in range(entrycount):
+        pos = 0x8+i*0x10
+        entry_id, status, data_size, data_offset = struct.unpack('<IIII', data[pos:pos+0x10])
+        if 0x8+data_offset+data_size > len(data):
+            raise ValueError("Entry data for id 0x%X is out-of-bounds for bdf_iter('%s')." % (entry_id, path))
+        yield {'id': entry_id, 'status': status, 'data_size': data_size, 'data_offset': data_offset, 'data': data[0x8+data_offset:0x8+data_offset+data_size]}
+
+# Decodes the certificate for an entry from bdf_iter on demand.
+def bdf_entry_x509(entry):
+    from cryptography import x509
+
+    return x509.load_der_x509_certificate(bytes(entry['data']))
+
+def bdf_fingerprint(data):
+    import hashlib
+
+    return hashlib.sha256(data).hexdigest()
+
+# hashlib only releases the GIL for data of at least 2048 bytes, and DER certificates are usually smaller: with one pool task per entry, 20k 1400-byte entries took 377ms vs 42ms serially.
+# Hence small data is hashed inline, and the pool (one task per worker, with a chunk of the large data each) is only used with multiple CPUs when there's enough large data for it to outweigh the overhead.
+# With a single CPU the chunked pool matches serial hashing (1MB entries: 163ms both), hence it's skipped there.
+BDF_HASH_GIL_MIN_SIZE = 0x800
+BDF_HASH_POOL_MIN_TOTAL = 0x400000
+
+def bdf_fingerprint_chunk(datas):
+    return [bdf_fingerprint(data) for data in datas]
+
+# Returns a dict of id(data) -> fingerprint. Entry data is interned (see bdf_read_data), hence identical entries across stores are the same object and are only hashed once.
+# The dedup costs ~20% with all-unique data (20k 1400-byte entries: 47ms vs 39ms), but the same store across N versions is only hashed once.
+def bdf_fingerprint_all(datas, max_workers=None):
+    unique = {}
+    for data in datas:
+        unique.setdefault(id(data), data)
+
+    out = {}
+    workers = max_workers or os.cpu_count() or 1
+    large = [data for data in unique.values() if len(data)>=BDF_HASH_GIL_MIN_SIZE]
+    if workers>1 and sum([len(data) for data in large])>=BDF_HASH_POOL_MIN_TOTAL:
+        from concurrent.futures import ThreadPoolExecutor
+
+        chunksize = (len(large)+workers-1)//workers
+        chunks = [large[i:i+chunksize] for i in range(0, len(large), chunksize)]
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for chunk, fingerprints in zip(chunks, executor.map(bdf_fingerprint_chunk, chunks)):
+                for data, fingerprint in zip(chunk, fingerprints):
+                    out[id(data)] = fingerprint
+
+    for key, data in unique.items():
+        if key not in out:
+            out[key] = bdf_fingerprint(data)
     return out
 
+# InPaths is a dict of Version -> list of .bdf paths. Entry data is hashed via bdf_fingerprint_all, and each unique certificate is only decoded once.
+def bdf_index_build(InPaths, max_workers=None):
+    from cryptography import x509
+
+    index = {'fingerprint': {}, 'subject': {}, 'issuer': {}, 'not_after': [], 'not_after_keys': [], 'versions': []}
+
+    entries = []
+    for Version, Paths in InPaths.items():
+        if isinstance(Paths, str):
+            Paths = [Paths]
+        index['versions'].append(Version)
+        for path in Paths:
+            tmp = bdf_read(path, load_x509=False)
+            if tmp is None:
+                print("bdf_index_build(): Skipping %s since bdf_read failed." % (path))
+                continue
+            is_cert = path.find("TrustedCerts")!=-1
+            for entry in tmp:
+                entries.append((Version, path, is_cert, entry))
+
+    fingerprints = bdf_fingerprint_all([entry['data'] for Version, path, is_cert, entry in entries], max_workers)
+
+    for Version, path, is_cert, entry in entries:
+        fingerprint = fingerprints[id(entry['data'])]
+        location = {'version': Version, 'path': path, 'id': entry['id'], 'status': entry['status']}
+        if fingerprint in index['fingerprint']:
+            index['fingerprint'][fingerprint]['locations'].append(location)
+            continue
+
+        record = {'fingerprint': fingerprint, 'data_size': entry['data_size'], 'locations': [location]}
+        if is_cert:
+            ent_x509 = x509.load_der_x509_certificate(entry['data'])
+            record['serial_number'] = ent_x509.serial_number
+            record['not_valid_before_utc'] = ent_x509.not_valid_before_utc
+            record['not_valid_after_utc'] = ent_x509.not_valid_after_utc
+            record['issuer'] = ent_x509.issuer.rfc4514_string()
+            record['subject'] = ent_x509.subject.rfc4514_string()
+
+            index['subject'].setdefault(record['subject'], []).append(fingerprint)
+            subjects = index['issuer'].setdefault(record['issuer'], [])
+            if record['subject'] not in subjects:
+                subjects.append(record['subject'])
+
+            index['not_after'].append((record['not_valid_after_utc'], fingerprint))
+
+        index['fingerprint'][fingerprint] = record
+
+    index['not_after'].sort()
+    index['not_after_keys'] = [not_after for not_after, fingerprint in index['not_after']]
+
+    return index
+
+def bdf_index_get_versions(index, fingerprint):
+    record = index['fingerprint'].get(fingerprint.lower())
+    if record is None:
+        return []
+    versions = set([location['version'] for location in record['locations']])
+    return [Version for Version in index['versions'] if Version in versions]
+
+def bdf_index_find_subject(index, subject):
+    return [index['fingerprint'][fingerprint] for fingerprint in index['subject'].get(subject, [])]
+
+def bdf_index_find_issued(index, issuer):
+    return list(index['issuer'].get(issuer, []))
+
+def bdf_index_expiring_before(index, date):
+    import datetime
+
+    if date.tzinfo is None:
+        date = date.replace(tzinfo=datetime.timezone.utc)
+    pos = bisect.bisect_left(index['not_after_keys'], date)
+    return [index['fingerprint'][fingerprint] for not_after, fingerprint in index['not_after'][:pos]]
+
 def bdf_diff(prev, cur):
     out = []
 
@@ -42,6 +221,9 @@ def bdf_diff(prev, cur):
         print("bdf_diff: cur is empty / {error occured during bdf_read}.")
         return None
 
+    if prev is cur:
+        return out
+
     for entry in cur:
         found = False
         entrytype = None
@@ -81,19 +263,58 @@ def bdf_diff(prev, cur):
             out.append(ent)
     return out
 
+# Streaming variant of bdf_diff: prev/cur are iterators of entries sorted by id (such as from bdf_iter), which are merge-joined. This yields the same entries as bdf_diff, ordered by id.
+# Raises ValueError when prev/cur aren't sorted, since the entries yielded before that point would otherwise look like a complete diff.
+def bdf_diff_iter(prev, cur):
+    prev = iter(prev)
+    cur = iter(cur)
+    prev_entry = next(prev, None)
+    entry = next(cur, None)
+    prev_id = None
+    cur_id = None
+
+    while prev_entry is not None or entry is not None:
+        if prev_entry is not None and prev_id is not None and prev_entry['id'] <= prev_id:
+            raise ValueError("bdf_diff_iter: prev isn't sorted by id (0x%X follows 0x%X)." % (prev_entry['id'], prev_id))
+        if entry is not None and cur_id is not None and entry['id'] <= cur_id:
+            raise ValueError("bdf_diff_iter: cur isn't sorted by id (0x%X follows 0x%X)." % (entry['id'], cur_id))
+
+        if entry is None or (prev_entry is not None and prev_entry['id'] < entry['id']):
+            yield {'type': 'removed', 'status_updated': False, 'data_updated': False, 'entry': prev_entry}
+            prev_id = prev_entry['id']
+            prev_entry = next(prev, None)
+        elif prev_entry is None or entry['id'] < prev_entry['id']:
+            yield {'type': 'added', 'status_updated': False, 'data_updated': False, 'entry': entry}
+            cur_id = entry['id']
+            entry = next(cur, None)
+        else:
+            status_updated = entry['status'] != prev_entry['status']
+            data_updated = entry['data'] != prev_entry['data']
+            if status_updated or data_updated:
+                yield {'type': 'updated', 'status_updated': status_updated, 'data_updated': data_updated, 'entry': entry}
+            prev_id = prev_entry['id']
+            cur_id = entry['id']
+            prev_entry = next(prev, None)
+            entry = next(cur, None)
+
+def bdf_print(out):
+    print("[")
+    for entry in out:
+        if 'data_x509' in entry:
+            from cryptography.hazmat.primitives import hashes
+
+            ent_x509 = entry['data_x509']
+            fingerprint = binascii.hexlify(ent_x509.fingerprint(hashes.SHA256())).decode('utf-8')
+            tmpstr = ", 'x509': {'fingerprint': '%s', ' serial_number': '0x%X', 'not_valid_before_utc': '%s', 'not_valid_after_utc': '%s', 'issuer': '%s', 'subject': '%s', 'signature_algorithm_oid': '%s'}" % (fingerprint, ent_x509.serial_number, ent_x509.not_valid_before_utc, ent_x509.not_valid_after_utc, ent_x509.issuer, ent_x509.subject, ent_x509.signature_algorithm_oid)
+        else:
+            tmpstr = ""
+        print("{'id': %d, 'status': %d, 'data_size': 0x%X, 'data_offset': 0x%X%s}," % (entry['id'], entry['status'], entry['data_size'], entry['data_offset'], tmpstr))
+    print("]")
+
 if __name__ == "__main__":
     if len(sys.argv)>1:
         out = bdf_read(sys.argv[1])
-        print("[")
-        for entry in out:
-            if 'data_x509' in entry:
-                ent_x509 = entry['data_x509']
-                fingerprint = binascii.hexlify(ent_x509.fingerprint(hashes.SHA256())).decode('utf-8')
-                tmpstr = ", 'x509': {'fingerprint': '%s', ' serial_number': '0x%X', 'not_valid_before_utc': '%s', 'not_valid_after_utc': '%s', 'issuer': '%s', 'subject': '%s', 'signature_algorithm_oid': '%s'}" % (fingerprint, ent_x509.serial_number, ent_x509.not_valid_before_utc, ent_x509.not_valid_after_utc, ent_x509.issuer, ent_x509.subject, ent_x509.signature_algorithm_oid)
-            else:
-                tmpstr = ""
-            print("{'id': %d, 'status': %d, 'data_size': 0x%X, 'data_offset': 0x%X%s}," % (entry['id'], entry['status'], entry['data_size'], entry['data_offset'], tmpstr))
-        print("]")
+        if out is not None:
+            bdf_print(out)
     else:
         print("Usage:\n%s <ssl .bdf path>" % (sys.argv[0]))
-